@@ -1,8 +1,22 @@
-﻿import numpy as np
+﻿import heapq
+import math
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
 import pandas as pd
 import statsmodels.api as sm
+from statsmodels.tsa.adfvalues import mackinnonp
 from statsmodels.tsa.stattools import adfuller
 
+METRIC_COLUMNS = ['beta', 'alpha', 'spread', 'z_score']
+BACKTEST_SUMMARY_COLUMNS = ['pnl', 'flips', 'max_drawdown']
+BACKTEST_BATCH_CELLS = 4_000_000  # (threshold pairs x rows) evaluated per block in run_backtest_batch
+HUBER_C = 1.345            # Huber tuning constant, in units of the robust residual scale
+HUBER_ITERATIONS = 4       # IRLS reweighting passes after the least-squares start
+HUBER_BLOCK_CELLS = 50_000     # (rows x window) cells fitted per block in rolling_huber (cache-sized)
+
 class KalmanFilterReg:
     """
     Bonus: Online Kalman Filter for Dynamic Hedge Ratio estimation.
@@ -10,77 +24,927 @@ class KalmanFilterReg:
     State Space Model:
     y_t = beta_t * x_t + epsilon_t
     beta_t = beta_{t-1} + nu_t
+
+    The 2-state update is written out in closed form on plain floats
+    (state [intercept, slope], symmetric covariance [[p00, p01], [p01, p11]])
+    so a tick costs a handful of multiplies and no array allocations.
     """
     def __init__(self, delta=1e-4, R=1e-3):
         # delta: Process noise variance (flexibility of beta)
         # R: Measurement noise variance
         self.delta = delta 
         self.R = R
-        self.beta = np.zeros(2) # [intercept, slope]
-        self.P = np.eye(2)      # Covariance matrix
+        self.reset()
+
+    def reset(self):
+        self.intercept = 0.0
+        self.slope = 0.0
+        self.p00, self.p01, self.p11 = 1.0, 0.0, 1.0  # Covariance matrix (identity)
         
     def update(self, x, y):
         # x: Independent variable (e.g., BTC returns)
         # y: Dependent variable (e.g., ETH returns)
-        
-        # Observation matrix H = [1, x]
-        H = np.array([1.0, x])
-        
-        # Prediction (Random Walk Prior)
-        # beta_pred = beta_prev
-        # P_pred = P_prev + Q
-        Q = self.delta * np.eye(2)
-        P_pred = self.P + Q
-        
+        if x != x or y != y:
+            # Unaligned row (NaN leg): leave the state untouched
+            return np.nan, np.nan
+
+        # Observation H = [1, x]; random-walk prior P_pred = P + delta * I
+        p00 = self.p00 + self.delta
+        p01 = self.p01
+        p11 = self.p11 + self.delta
+
         # Measurement update
-        y_pred = H @ self.beta
-        error = y - y_pred
-        
-        # Kalman Gain
-        S = H @ P_pred @ H.T + self.R
-        K = P_pred @ H.T / S
-        
-        # Update State
-        self.beta = self.beta + K * error
-        self.P = (np.eye(2) - np.outer(K, H)) @ P_pred
+        error = y - (self.intercept + self.slope * x)
+        ph0 = p00 + p01 * x          # P_pred @ H.T
+        ph1 = p01 + p11 * x
+        S = ph0 + ph1 * x + self.R   # H @ P_pred @ H.T + R
+        k0 = ph0 / S                 # Kalman Gain
+        k1 = ph1 / S
+
+        # Update State: beta += K * error, P = (I - K H) P_pred
+        self.intercept += k0 * error
+        self.slope += k1 * error
+        self.p00 = p00 - k0 * ph0
+        self.p01 = p01 - k0 * ph1
+        self.p11 = p11 - k1 * ph1
         
-        return self.beta[1], self.beta[0] # slope, intercept
+        return self.slope, self.intercept # slope, intercept
+
+    def filter(self, x, y):
+        """
+        Batch recursion over aligned arrays, continuing from the current state.
+        Returns (slopes, intercepts) arrays, one entry per input row.
+        """
+        x = np.asarray(x, dtype=float).tolist()
+        y = np.asarray(y, dtype=float).tolist()
+        n = len(x)
+        slopes = np.empty(n)
+        intercepts = np.empty(n)
+
+        delta, R = self.delta, self.R
+        a, b = self.intercept, self.slope
+        p00, p01, p11 = self.p00, self.p01, self.p11
+        for i in range(n):
+            xi, yi = x[i], y[i]
+            if xi != xi or yi != yi:
+                slopes[i] = intercepts[i] = np.nan
+                continue
+            p00 += delta
+            p11 += delta
+            error = yi - (a + b * xi)
+            ph0 = p00 + p01 * xi
+            ph1 = p01 + p11 * xi
+            S = ph0 + ph1 * xi + R
+            k0 = ph0 / S
+            k1 = ph1 / S
+            a += k0 * error
+            b += k1 * error
+            p00 -= k0 * ph0
+            p01 -= k0 * ph1
+            p11 -= k1 * ph1
+            slopes[i] = b
+            intercepts[i] = a
+
+        self.intercept, self.slope = a, b
+        self.p00, self.p01, self.p11 = p00, p01, p11
+        return slopes, intercepts
+
+    def get_state(self) -> dict:
+        """Snapshot of the filter so a live session can resume without refiltering."""
+        return {
+            'delta': self.delta, 'R': self.R,
+            'intercept': self.intercept, 'slope': self.slope,
+            'p00': self.p00, 'p01': self.p01, 'p11': self.p11,
+        }
+
+    def set_state(self, state: dict):
+        for key in ('delta', 'R', 'intercept', 'slope', 'p00', 'p01', 'p11'):
+            setattr(self, key, state[key])
+
+class RollingZScore:
+    """
+    Streaming rolling z-score: (v - mean) / (std + 1e-8) over the last
+    `window` samples (sample std, ddof=1), matching pandas rolling: a NaN
+    input (estimator warm-up, degenerate fit) restarts the window, so the
+    next `window - 1` outputs are NaN too. Sums are rebuilt exactly every
+    `window` updates to bound floating-point drift.
+    """
+    def __init__(self, window=20):
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        self.ring = [0.0] * self.window
+        self.n = 0
+        self.pos = 0
+        self.s1 = self.s2 = 0.0
+        self.since_resync = 0
+
+    def update(self, v):
+        if v != v:  # NaN
+            if self.n:
+                self.reset()
+            return np.nan
+        w = self.window
+        if self.n == w:
+            old = self.ring[self.pos]
+            self.s1 -= old
+            self.s2 -= old * old
+        else:
+            self.n += 1
+        self.ring[self.pos] = v
+        self.s1 += v
+        self.s2 += v * v
+        self.pos = self.pos + 1 if self.pos + 1 < w else 0
+
+        if self.n < w:
+            return np.nan
+
+        self.since_resync += 1
+        if self.since_resync >= w:
+            self.s1 = math.fsum(self.ring)
+            self.s2 = math.fsum(x * x for x in self.ring)
+            self.since_resync = 0
+
+        mean = self.s1 / w
+        var = (self.s2 - self.s1 * mean) / (w - 1) if w > 1 else 0.0
+        std = math.sqrt(var) if var > 0.0 else 0.0
+        return (v - mean) / (std + 1e-8)
+
+    def catch_up(self, values):
+        update = self.update
+        return np.array([update(v) for v in np.asarray(values, dtype=float).tolist()], dtype=float)
+
+class RollingQuantile:
+    """
+    Streaming rolling quantile over the last `window` samples, matching
+    pandas rolling(window).quantile(q) (linear interpolation; median is the
+    mean of the two middle values). Two heaps split the window at the
+    quantile; expired samples are deleted lazily when they surface at a
+    heap top, and both heaps are rebuilt from the ring once they hold more
+    than 2 * window entries (expired ones buried under a trend never
+    surface), so memory stays O(window) and each update amortised
+    O(log window). Entries are (value, seq) so equal values never make a
+    deletion ambiguous.
+    Returns NaN until the window is full or while it holds a NaN.
+    """
+    def __init__(self, window=20, q=0.5):
+        self.window = int(window)
+        self.q = q
+        self.reset()
+
+    def reset(self):
+        self.ring = [math.nan] * self.window
+        self.seq = 0
+        self.low = []       # Max-heap of (-value, -seq): the lower part of the window
+        self.high = []      # Min-heap of (value, seq)
+        self.n_low = self.n_high = 0
+        self.expired = set()
+        self.nans = 0
+
+    def _prune(self, heap, sign):
+        while heap and sign * heap[0][1] in self.expired:
+            self.expired.discard(sign * heapq.heappop(heap)[1])
+
+    def _rebuild(self):
+        """Heaps from the live samples in the ring only (drops every expired entry)."""
+        w, seq = self.window, self.seq
+        live = sorted(
+            (self.ring[k % w], k) for k in range(max(0, seq - w), seq) if self.ring[k % w] == self.ring[k % w]
+        )
+        self.n_low, self.n_high = 0, len(live)
+        self.low = []
+        self.high = live  # A sorted list is a valid min-heap
+        self.expired.clear()
+        self._rebalance()
+
+    def _rebalance(self):
+        m = self.n_low + self.n_high
+        target = int(math.floor(self.q * (m - 1))) + 1 if m else 0
+        while self.n_low > target:
+            v, k = heapq.heappop(self.low)
+            heapq.heappush(self.high, (-v, -k))
+            self.n_low -= 1
+            self.n_high += 1
+            self._prune(self.low, -1)
+        while self.n_low < target:
+            v, k = heapq.heappop(self.high)
+            heapq.heappush(self.low, (-v, -k))
+            self.n_low += 1
+            self.n_high -= 1
+            self._prune(self.high, 1)
+
+    def update(self, v):
+        w = self.window
+        seq = self.seq
+        self.seq += 1
+        slot = seq % w
+        if seq >= w:
+            old = self.ring[slot]
+            if old != old:
+                self.nans -= 1
+            else:
+                self.expired.add(seq - w)
+                if self.low and (old, seq - w) <= (-self.low[0][0], -self.low[0][1]):
+                    self.n_low -= 1
+                    self._prune(self.low, -1)
+                else:
+                    self.n_high -= 1
+                    self._prune(self.high, 1)
+        self.ring[slot] = v
+        if v != v:
+            self.nans += 1
+        elif self.low and (v, seq) <= (-self.low[0][0], -self.low[0][1]):
+            heapq.heappush(self.low, (-v, -seq))
+            self.n_low += 1
+        else:
+            heapq.heappush(self.high, (v, seq))
+            self.n_high += 1
+        self._rebalance()
+        if len(self.low) + len(self.high) > 2 * w:
+            self._rebuild()
+
+        if self.seq < w or self.nans:
+            return np.nan
+        lo = -self.low[0][0]
+        pos = self.q * (w - 1)
+        frac = pos - math.floor(pos)
+        if frac == 0.0:
+            return lo
+        hi = self.high[0][0]
+        if self.q == 0.5:
+            return (lo + hi) / 2
+        return lo + (hi - lo) * frac
+
+    def catch_up(self, values):
+        update = self.update
+        return np.array([update(v) for v in np.asarray(values, dtype=float).tolist()], dtype=float)
+
+class RollingOLS:
+    """
+    Streaming rolling-window OLS: y = alpha + beta * x, plus spread z-score.
+    Keeps running sums of x, y, xy, x^2 over the last `window` pairs (and
+    spread moments via RollingZScore), so each tick costs O(1).
+    Matches QuantEngine.calculate_metrics(method='OLS') row for row.
+
+    For numerical stability x/y are stored relative to a reference price,
+    and every `window` updates the sums are rebuilt exactly from the ring
+    (amortised O(1)) after re-centring on the latest prices.
+    A window with constant x has no hedge ratio: like pandas, its beta /
+    alpha / spread are NaN and the spread z-score restarts after it.
+    """
+    def __init__(self, window=20):
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        w = self.window
+        self.xs = [0.0] * w    # Centred x ring
+        self.ys = [0.0] * w    # Centred y ring
+        self.n = 0             # Pairs currently in the window
+        self.pos = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self.x0 = self.y0 = None
+        self.last_x = None
+        self.flat_run = 0      # Consecutive identical x values ending at the newest
+        self.since_resync = 0
+        self.zscore = RollingZScore(w)
+
+    def _resync(self, x, y):
+        # Re-centre stored values on the latest prices and rebuild sums exactly
+        dx0, dy0 = x - self.x0, y - self.y0
+        self.x0, self.y0 = x, y
+        xs = self.xs = [v - dx0 for v in self.xs]
+        ys = self.ys = [v - dy0 for v in self.ys]
+        self.sx = math.fsum(xs)
+        self.sy = math.fsum(ys)
+        self.sxx = math.fsum(v * v for v in xs)
+        self.sxy = math.fsum(a * b for a, b in zip(xs, ys))
+        self.since_resync = 0
+
+    def update(self, x, y):
+        """Consume one aligned pair. Returns (beta, alpha, spread, z_score); NaN while warming up."""
+        if x != x or y != y:
+            # Unaligned row (NaN leg) carries no information: skip it
+            return np.nan, np.nan, np.nan, np.nan
+        w = self.window
+        if self.x0 is None:
+            self.x0, self.y0 = x, y
+        dx, dy = x - self.x0, y - self.y0
+        # Exact flatness check (pandas rolling var does the same): the sums alone
+        # leave rounding noise of either sign on a constant window
+        self.flat_run = self.flat_run + 1 if x == self.last_x else 1
+        self.last_x = x
+
+        # 1. Price window sums
+        if self.n == w:
+            ox, oy = self.xs[self.pos], self.ys[self.pos]
+            self.sx -= ox
+            self.sy -= oy
+            self.sxx -= ox * ox
+            self.sxy -= ox * oy
+        else:
+            self.n += 1
+        self.xs[self.pos] = dx
+        self.ys[self.pos] = dy
+        self.sx += dx
+        self.sy += dy
+        self.sxx += dx * dx
+        self.sxy += dx * dy
+        self.pos = self.pos + 1 if self.pos + 1 < w else 0
+
+        if self.n < w:
+            return np.nan, np.nan, np.nan, np.nan
+
+        self.since_resync += 1
+        if self.since_resync >= w:
+            self._resync(x, y)
+
+        # 2. Hedge ratio (ddof cancels between cov and var)
+        mx, my = self.sx / w, self.sy / w
+        var_x = self.sxx - self.sx * mx
+        cov_xy = self.sxy - self.sx * my
+        if self.flat_run >= w or var_x <= 0.0:
+            return np.nan, np.nan, np.nan, self.zscore.update(np.nan)
+        beta = cov_xy / var_x
+        alpha = (my + self.y0) - beta * (mx + self.x0)
+        spread = y - (beta * x + alpha)
+
+        # 3. Spread z-score
+        return beta, alpha, spread, self.zscore.update(spread)
+
+    def catch_up(self, x, y):
+        """
+        Bulk entry point: feed arrays of new aligned pairs in order.
+        Returns (beta, alpha, spread, z_score) arrays for those rows.
+        """
+        out = np.full((len(x), 4), np.nan)
+        update = self.update
+        for i, (xi, yi) in enumerate(zip(np.asarray(x, dtype=float).tolist(), np.asarray(y, dtype=float).tolist())):
+            out[i] = update(xi, yi)
+        return out[:, 0], out[:, 1], out[:, 2], out[:, 3]
+
+class RollingKalman:
+    """
+    Streaming Kalman hedge ratio plus rolling spread z-score.
+    Same contract as RollingOLS.catch_up; the filter state carries over
+    between calls so only new rows are ever filtered.
+    """
+    def __init__(self, window=20, delta=1e-4, R=1e-3):
+        self.window = int(window)
+        self.kf = KalmanFilterReg(delta, R)
+        self.zscore = RollingZScore(window)
+
+    def reset(self):
+        self.kf.reset()
+        self.zscore.reset()
+
+    def catch_up(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        beta, alpha = self.kf.filter(x, y)
+        spread = y - (beta * x + alpha)
+        return beta, alpha, spread, self.zscore.catch_up(spread)
+
+def huber_fit(X, Y, iterations=HUBER_ITERATIONS, c=HUBER_C):
+    """
+    Huber regression Y = alpha + beta * X for every row of the (k, w)
+    windows X / Y at once, by iteratively reweighted least squares: start
+    from least squares, then downweight residuals beyond c * 1.4826 * MAD
+    (weight c*s/|r|) and refit, `iterations` times. Windows whose MAD is 0
+    keep the least-squares fit. Returns (beta, alpha).
+    """
+    wts = np.ones_like(X)
+    mid = X.shape[1] // 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for it in range(iterations + 1):
+            sw = wts.sum(axis=1)
+            mu = np.einsum('ij,ij->i', wts, X) / sw
+            mv = np.einsum('ij,ij->i', wts, Y) / sw
+            du = X - mu[:, None]
+            dv = Y - mv[:, None]
+            wdu = wts * du
+            sxx = np.einsum('ij,ij->i', wdu, du)
+            beta = np.einsum('ij,ij->i', wdu, dv) / np.where(sxx > 0, sxx, np.nan)
+            if it == iterations:
+                break
+            r = np.abs(dv - beta[:, None] * du)
+            # Scale from the (upper) median absolute residual; a partition is enough.
+            # A zero MAD (most residuals exactly 0, e.g. carried-forward prices) would
+            # zero every other weight: such windows keep the least-squares weights.
+            cut = (c * 1.4826) * np.partition(r, mid, axis=1)[:, mid:mid + 1]
+            wts = np.where((r > cut) & (cut > 0), cut / r, 1.0)
+    return beta, mv - beta * mu
+
+def rolling_huber(x, y, med_x, med_y, window=20, iterations=HUBER_ITERATIONS, c=HUBER_C):
+    """
+    Rolling Huber hedge ratio over `window` rows. Each window is centred on
+    its rolling medians (med_x / med_y, aligned with x / y) before the IRLS
+    fit, which keeps the weighted sums well conditioned at price level.
+    Returns (beta, alpha) arrays, NaN until the first full window.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    beta, alpha = np.full(n, np.nan), np.full(n, np.nan)
+    if n < window:
+        return beta, alpha
+    xw = np.lib.stride_tricks.sliding_window_view(x, window)
+    yw = np.lib.stride_tricks.sliding_window_view(y, window)
+    ends = np.arange(window - 1, n)
+    step = max(1, HUBER_BLOCK_CELLS // window)
+    for k in range(0, len(ends), step):
+        e = ends[k:k + step]
+        mx, my = med_x[e], med_y[e]
+        b, a = huber_fit(xw[k:k + step] - mx[:, None], yw[k:k + step] - my[:, None], iterations, c)
+        beta[e] = b
+        alpha[e] = my + a - b * mx
+    return beta, alpha
+
+class RollingHuber:
+    """
+    Streaming rolling Huber regression plus spread z-score (same contract as
+    RollingOLS.catch_up). The window medians used for centring come from
+    RollingQuantile, advanced one tick at a time; only the last window-1
+    pairs are kept, so each call fits just the windows ending on new rows.
+    Matches QuantEngine.calculate_metrics(method='Robust (Huber)').
+    """
+    def __init__(self, window=20):
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        self.med_x = RollingQuantile(self.window)
+        self.med_y = RollingQuantile(self.window)
+        self.zscore = RollingZScore(self.window)
+        self.tail = (np.empty(0), np.empty(0), np.empty(0), np.empty(0))
+
+    def catch_up(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        out = np.full((4, len(x)), np.nan)
+        # Unaligned rows (NaN leg) are skipped, as in RollingOLS
+        ok = ~(np.isnan(x) | np.isnan(y))
+        xv, yv = x[ok], y[ok]
+        hx, hy, hmx, hmy = (np.r_[old, new] for old, new in zip(
+            self.tail, (xv, yv, self.med_x.catch_up(xv), self.med_y.catch_up(yv))
+        ))
+        beta, alpha = rolling_huber(hx, hy, hmx, hmy, self.window)
+        h = len(hx) - len(xv)
+        beta, alpha = beta[h:], alpha[h:]
+        keep = max(0, len(hx) - (self.window - 1))
+        self.tail = (hx[keep:], hy[keep:], hmx[keep:], hmy[keep:])
+
+        spread = yv - (beta * xv + alpha)
+        out[:, ok] = beta, alpha, spread, self.zscore.catch_up(spread)
+        return out[0], out[1], out[2], out[3]
+
+def make_streaming_estimator(method, window=20, delta=1e-4, R=1e-3):
+    """Streaming estimator (catch_up(x, y) -> beta, alpha, spread, z_score) for `method`, or None."""
+    if method == 'OLS':
+        return RollingOLS(window)
+    if method == 'Kalman':
+        return RollingKalman(window, delta, R)
+    if method == 'Robust (Huber)':
+        return RollingHuber(window)
+    return None
+
+class MetricsSession:
+    """
+    Server-side incremental analytics state for one pair and parameter set
+    (window, method, and delta/R for Kalman).
+    Remembers the last aligned timestamp it consumed and, on every dashboard
+    rerun, feeds only newer rows to the streaming estimator. Results for rows
+    still in the live buffer are kept and re-attached to the aligned frame.
+    The session resets (and replays the buffer) if its cursor was evicted
+    unseen, or if rows at or before the cursor changed since they were fed,
+    e.g. a late tick on the lagging leg inserting an earlier aligned row.
+    `generation` counts resets, so downstream state built on the results
+    (see StationarityMonitor) can tell when they were recomputed.
+    """
+    def __init__(self, window=20, method='OLS', delta=1e-4, R=1e-3):
+        self.window = window
+        self.method = method
+        self.delta = delta
+        self.R = R
+        self.lock = Lock()
+        self.generation = 0
+        self.reset()
+
+    def _make_estimator(self):
+        estimator = make_streaming_estimator(self.method, self.window, self.delta, self.R)
+        if estimator is None:
+            raise ValueError(f"No streaming estimator for method '{self.method}'")
+        return estimator
+
+    def reset(self):
+        self.estimator = self._make_estimator()
+        self.generation += 1
+        self.last_ts = None
+        self.results = None
+        self.seen = None  # (index, x, y) arrays of the rows fed so far
+
+    def _history_changed(self, df):
+        index = df.index.to_numpy()
+        start = self.seen[0].searchsorted(index[0])
+        ts, x, y = (a[start:] for a in self.seen)
+        n = df.index.searchsorted(self.last_ts, side='right')
+        return not (
+            n == len(ts)
+            and np.array_equal(index[:n], ts)
+            and np.array_equal(df['x'].to_numpy(dtype=float)[:n], x, equal_nan=True)
+            and np.array_equal(df['y'].to_numpy(dtype=float)[:n], y, equal_nan=True)
+        )
+
+    def advance(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Same output as QuantEngine.calculate_metrics, computed only over new rows."""
+        if df.empty:
+            return df
+
+        with self.lock:
+            # Our cursor fell out of the buffer (or the buffer went back in time): start over
+            if self.last_ts is not None and not (df.index[0] <= self.last_ts <= df.index[-1]):
+                self.reset()
+            # Rows inserted or revised behind the cursor: the streaming state is stale, replay
+            elif self.last_ts is not None and self._history_changed(df):
+                self.reset()
+
+            new = df if self.last_ts is None else df[df.index > self.last_ts]
+            if len(new):
+                cols = self.estimator.catch_up(new['x'].to_numpy(dtype=float), new['y'].to_numpy(dtype=float))
+                fresh = pd.DataFrame(dict(zip(METRIC_COLUMNS, cols)), index=new.index)
+                fed = (new.index.to_numpy(), new['x'].to_numpy(dtype=float), new['y'].to_numpy(dtype=float))
+                if self.results is None:
+                    self.results, self.seen = fresh, fed
+                else:
+                    kept = self.results.index >= df.index[0]
+                    self.results = pd.concat([self.results[kept], fresh])
+                    start = self.seen[0].searchsorted(df.index.to_numpy()[0])
+                    self.seen = tuple(np.concatenate([old[start:], add]) for old, add in zip(self.seen, fed))
+                self.last_ts = new.index[-1]
+
+            return df.join(self.results.reindex(df.index))
+
+def _result_nbytes(value):
+    """Approximate memory held by a cached analytics result."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_result_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_result_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+class AnalyticsCache:
+    """
+    LRU cache of dashboard analytics results, shared across reruns.
+    Keys carry the version of the data a result was computed from (e.g.
+    TradeStore.data_version) plus every parameter it depends on, so entries
+    never need invalidating: new ticks simply produce new keys and old ones
+    age out. Bounded by entry count and approximate result size.
+    Results are shared between callers and must not be mutated.
+    """
+    def __init__(self, max_entries=64, max_bytes=256 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()  # key -> (value, nbytes)
+            self.nbytes = 0
+            self.hits = self.misses = 0
+
+    def get(self, key, compute):
+        """Cached result for `key`, computing (and storing) it with compute() on a miss."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = compute()
+        size = _result_nbytes(value)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            # Evict least recently used, always keeping the entry just added
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.nbytes > self.max_bytes):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.nbytes -= evicted
+        return value
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries), 'mb': self.nbytes / 2**20,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+class IncrementalADF:
+    """
+    Fixed-lag ADF regression (constant, `lag` lagged differences) kept as
+    running normal equations X'X / X'y / y'y over a sliding sample range.
+    push_many() builds the regression rows of a batch of new samples with
+    lagmat-style slices and adds them in one X'X product; drop_before()
+    subtracts the expired rows the same way. Same statistic as
+    adfuller(series, maxlag=lag, autolag=None) over the samples held.
+    The sums are rebuilt from the held samples after every len(rows) removals.
+    """
+    def __init__(self, lag=1):
+        self.lag = int(lag)
+        self.reset()
+
+    def reset(self):
+        k = self.lag + 2
+        self.ts = np.empty(0)      # Held samples (timestamps / values), oldest first
+        self.values = np.empty(0)
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+        self.removed = 0
+
+    @property
+    def n_rows(self):
+        return max(len(self.values) - self.lag - 1, 0)
+
+    def _design(self, v):
+        """Regression rows [const, y_{t-1}, dy_{t-1}, ..., dy_{t-lag}] -> dy_t for every full window of v."""
+        lag, m = self.lag, len(v)
+        if m < lag + 2:
+            return np.empty((0, lag + 2)), np.empty(0)
+        dv = np.diff(v)
+        X = np.empty((m - lag - 1, lag + 2))
+        X[:, 0] = 1.0
+        X[:, 1] = v[lag:m - 1]
+        for i in range(1, lag + 1):
+            X[:, i + 1] = dv[lag - i:m - 1 - i]
+        return X, dv[lag:]
+
+    def _accumulate(self, X, y, sign=1.0):
+        if len(y):
+            self.xtx += sign * (X.T @ X)
+            self.xty += sign * (X.T @ y)
+            self.yty += sign * float(y @ y)
+
+    def push_many(self, ts, values):
+        """Append samples (timestamps ascending) and add their regression rows."""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        context = self.values[-(self.lag + 1):] if len(self.values) else self.values
+        self._accumulate(*self._design(np.concatenate([context, values])))
+        self.ts = np.concatenate([self.ts, np.asarray(ts)]) if len(self.ts) else np.asarray(ts)
+        self.values = np.concatenate([self.values, values])
+
+    def push(self, t, v):
+        self.push_many([t], [v])
+
+    def drop_before(self, t0):
+        """Forget samples older than t0 (and every row that uses one)."""
+        d = int(self.ts.searchsorted(t0)) if len(self.ts) else 0
+        if not d:
+            return
+        before = self.n_rows
+        # Rows using sample d-1 or older: the first min(d, rows) rows
+        self._accumulate(*self._design(self.values[:d + self.lag + 1]), sign=-1.0)
+        self.ts, self.values = self.ts[d:], self.values[d:]
+        self.removed += before - self.n_rows
+        if self.n_rows and self.removed >= self.n_rows:
+            k = self.lag + 2
+            self.xtx, self.xty, self.yty = np.zeros((k, k)), np.zeros(k), 0.0
+            self._accumulate(*self._design(self.values))
+            self.removed = 0
+
+    def result(self):
+        """(adf_stat, p_value, n_obs) or None with too few rows."""
+        n, k = self.n_rows, self.lag + 2
+        if n <= k + 2:
+            return None
+        try:
+            inv = np.linalg.inv(self.xtx)
+        except np.linalg.LinAlgError:
+            return None
+        beta = inv @ self.xty
+        sigma2 = max(self.yty - beta @ self.xty, 0.0) / (n - k)
+        se = math.sqrt(sigma2 * inv[1, 1]) if sigma2 * inv[1, 1] > 0 else 0.0
+        if se == 0.0:
+            return None
+        stat = beta[1] / se
+        return stat, mackinnonp(stat, regression='c', N=1), n
+
+class StationarityMonitor:
+    """
+    Cached ADF test on a live spread for one pair and model.
+    update() re-tests only when due: after `min_interval_s` if any sample
+    arrived, or at once when `min_new_samples` have. Otherwise it returns
+    the cached result, which carries its sample range (start / end, n_obs)
+    and is reported with its age.
+    mode='full' runs adfuller with AIC lag search on the whole spread;
+    mode='fast' uses IncrementalADF at a fixed `lag`, feeding it only
+    samples newer than the last test and dropping those that left the frame.
+    Pass the producer's `generation` (MetricsSession.generation) to update():
+    when it changes, the spread was recomputed and the cached state is reset.
+    """
+    def __init__(self, mode='full', lag=1, min_interval_s=10.0, min_new_samples=500):
+        self.mode = mode
+        self.lag = lag
+        self.min_interval_s = min_interval_s
+        self.min_new_samples = min_new_samples
+        self.lock = Lock()
+        self.generation = None
+        self.reset()
+
+    def reset(self):
+        self.fast = IncrementalADF(self.lag) if self.mode == 'fast' else None
+        self.fed_ts = None   # Last sample fed to the fast regression
+        self.last_ts = None  # Last index value seen by the previous test
+        self.cached = None
+        self.computed_at = None
+
+    def _due(self, index, now):
+        if self.computed_at is None or self.last_ts is None:
+            return True
+        if not len(index) or index[-1] < self.last_ts:
+            return True
+        new = len(index) - index.searchsorted(self.last_ts, side='right')
+        if new >= self.min_new_samples:
+            return True
+        return new > 0 and now - self.computed_at >= self.min_interval_s
+
+    def _test_fast(self, clean):
+        if self.fed_ts is not None and not (clean.index[0] <= self.fed_ts <= clean.index[-1]):
+            # Frame no longer contains our cursor (reset / replaced data): start over
+            self.fast.reset()
+            self.fed_ts = None
+        new = clean if self.fed_ts is None else clean[clean.index > self.fed_ts]
+        if len(new):
+            self.fast.push_many(new.index.to_numpy(), new.to_numpy(dtype=float))
+            self.fed_ts = new.index[-1]
+        self.fast.drop_before(clean.index.to_numpy()[0])
+        res = self.fast.result()
+        if res is None:
+            return None
+        stat, p_value, n_obs = res
+        return {'adf_stat': stat, 'p_value': p_value, 'is_stationary': p_value < 0.05, 'lag': self.lag, 'n_obs': n_obs}
+
+    def update(self, spread: pd.Series, now=None, generation=None):
+        """Latest ADF result for `spread` (re-tested if due), with 'age_s'; None if untestable."""
+        now = time.time() if now is None else now
+        with self.lock:
+            if generation != self.generation:
+                # Spread history was replayed upstream: samples already fed may have changed
+                self.reset()
+                self.generation = generation
+            if self._due(spread.index, now):
+                clean = spread.dropna()
+                if len(clean) < 30:
+                    self.cached = None
+                elif self.mode == 'fast':
+                    self.cached = self._test_fast(clean)
+                else:
+                    self.cached = QuantEngine.run_stationarity_test(clean)
+                if self.cached is not None:
+                    self.cached.update(start=clean.index[0], end=clean.index[-1], samples=len(clean), mode=self.mode)
+                self.last_ts = spread.index[-1] if len(spread) else None
+                self.computed_at = now
+            if self.cached is None:
+                return None
+            return dict(self.cached, age_s=now - self.computed_at)
+
+def collapse_ticks(ts, price, size):
+    """One row per distinct timestamp (mean price, summed size), time-ordered; NaN prices dropped."""
+    ts = np.asarray(ts)
+    price = np.asarray(price, dtype=np.float64)
+    size = np.zeros(len(ts)) if size is None else np.nan_to_num(np.asarray(size, dtype=np.float64))
+    ok = ~np.isnan(price)
+    if not ok.all():
+        ts, price, size = ts[ok], price[ok], size[ok]
+    if len(ts) > 1 and (ts[1:] < ts[:-1]).any():
+        order = np.argsort(ts, kind='stable')
+        ts, price, size = ts[order], price[order], size[order]
+    if not len(ts):
+        return ts, price, size
+    starts = np.flatnonzero(np.r_[True, ts[1:] != ts[:-1]])
+    counts = np.diff(np.r_[starts, len(ts)])
+    return ts[starts], np.add.reduceat(price, starts) / counts, np.add.reduceat(size, starts)
+
+def asof_align(tx, px, vx, ty, py, vy, tolerance=None, freq=None):
+    """
+    As-of alignment of two tick streams (x and y legs).
+    t*: timestamps as numbers (e.g. epoch seconds or int64 ns), p*: prices,
+    v*: sizes (or None). Ticks sharing a timestamp are collapsed (mean
+    price, summed size), then both streams are merged in one pass with
+    last-value-carried-forward prices.
+
+    tolerance: drop rows where either leg's last price is older than this
+               (same units as the timestamps; None = carry forever).
+    freq:      None = event sampling (one row per distinct timestamp of
+               either leg); a number = clock sampling on a fixed grid,
+               volumes summed over each (previous, current] interval.
+
+    Rows start once both legs have a price. Returns (timestamp, x, y, vol_x, vol_y).
+    """
+    tx, px, vx = collapse_ticks(tx, px, vx)
+    ty, py, vy = collapse_ticks(ty, py, vy)
+    if not len(tx) or not len(ty):
+        empty = np.empty(0)
+        return tx[:0], empty, empty.copy(), empty.copy(), empty.copy()
+    nx = len(tx)
+
+    if freq is None:
+        # Two sorted runs: the stable (timsort) argsort is a linear merge
+        keys = np.concatenate([tx, ty])
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        from_x = order < nx
+        # Index of the last x / y tick at or before each merged row
+        ix = np.maximum.accumulate(np.where(from_x, order, -1))
+        iy = np.maximum.accumulate(np.where(from_x, -1, order - nx))
+        # A timestamp ticked by both legs appears twice; keep its last row
+        last = np.r_[keys[1:] != keys[:-1], True]
+        keys, ix, iy = keys[last], ix[last], iy[last]
+        both = (ix >= 0) & (iy >= 0)
+        keys, ix, iy = keys[both], ix[both], iy[both]
+        vol_x = np.where(tx[ix] == keys, vx[ix], 0.0)
+        vol_y = np.where(ty[iy] == keys, vy[iy], 0.0)
+    else:
+        start = max(tx[0], ty[0])
+        first = -(-start // freq) * freq  # First grid point at or after both legs start
+        keys = np.arange(first, max(tx[-1], ty[-1]) + freq, freq, dtype=np.result_type(tx, freq))
+        ix = np.searchsorted(tx, keys, side='right') - 1
+        iy = np.searchsorted(ty, keys, side='right') - 1
+        # Interval volume from cumulative sums at consecutive grid points
+        cx, cy = np.r_[0.0, np.cumsum(vx)], np.r_[0.0, np.cumsum(vy)]
+        vol_x = np.diff(np.r_[cx[np.searchsorted(tx, keys[0] - freq, side='right')], cx[ix + 1]])
+        vol_y = np.diff(np.r_[cy[np.searchsorted(ty, keys[0] - freq, side='right')], cy[iy + 1]])
+
+    if tolerance is not None:
+        fresh = (keys - tx[ix] <= tolerance) & (keys - ty[iy] <= tolerance)
+        keys, ix, iy, vol_x, vol_y = keys[fresh], ix[fresh], iy[fresh], vol_x[fresh], vol_y[fresh]
+    return keys, px[ix], py[iy], vol_x, vol_y
+
+def _last_index(events, idx):
+    """Index of the most recent True at or before each column (-1 if none), per row."""
+    return np.maximum.accumulate(np.where(events, idx, -1), axis=-1)
+
+def backtest_positions(z, entry_z=2.0, exit_z=0.0):
+    """
+    Entry/exit hysteresis of the pair backtest without a per-row loop.
+    Short spread (-1) when z > entry_z, long spread (+1) when z < -entry_z;
+    a long exits on z >= exit_z, a short on z <= -exit_z, otherwise the
+    position is held. The first row is always flat.
+
+    The position at a row is the side of the last entry event, unless an
+    exit of that side happened after it, so it is rebuilt from forward-filled
+    event indices. entry_z / exit_z may be scalars (returns shape (n,)) or
+    equal-length arrays of threshold pairs (returns (pairs, n)).
+    """
+    z = np.asarray(z, dtype=np.float64)
+    batched = np.ndim(entry_z) > 0 or np.ndim(exit_z) > 0
+    entry, exit_ = np.broadcast_arrays(np.atleast_1d(entry_z)[:, None], np.atleast_1d(exit_z)[:, None])
+    idx = np.arange(len(z), dtype=np.int32 if len(z) < 2**31 else np.int64)
+
+    short = z > entry
+    long_ = ~short & (z < -entry)
+    short[:, :1] = long_[:, :1] = False
+    entries = short | long_
+    last_entry = _last_index(entries, idx)
+    side = np.take_along_axis(np.where(short, -1, long_.astype(np.int8)), np.maximum(last_entry, 0), axis=1)
+    side[last_entry < 0] = 0
+
+    long_exited = _last_index(~entries & (z >= exit_), idx) > last_entry
+    short_exited = _last_index(~entries & (z <= -exit_), idx) > last_entry
+    side[((side == 1) & long_exited) | ((side == -1) & short_exited)] = 0
+    return side if batched else side[0]
 
 class QuantEngine:
     @staticmethod
-    def prepare_aligned_data(df: pd.DataFrame, sym_x: str, sym_y: str):
+    def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
         """
-        Aligns prices by timestamp using pivot and ffill.
-        Returns clean dataframe with 'x' and 'y' columns.
+        Lower-cases / strips headers and maps common column aliases
+        (close/last -> price, ticker/pair/instrument -> symbol,
+        date/time/datetime -> timestamp). Pre-aligned wide files
+        (x / y columns) are left as they are.
         """
-        if df.empty: return pd.DataFrame()
-
-        # Work on a copy to avoid side effects and allow column normalization
-        df = df.copy()
-        
         # Normalize columns: Strip whitespace and convert to lowercase
         # This fixes issues where CSV headers have spaces like " price"
-        df.columns = df.columns.str.strip().str.lower()
-        
-        # --- NEW: Handle Pre-Aligned / Analytics Export Data (Wide Format) ---
-        # If the file already contains 'x' and 'y' columns (like the statarb_analytics.csv)
+        df = df.rename(columns=lambda c: str(c).strip().lower())
         if {'x', 'y'}.issubset(df.columns):
-            # Ensure timestamp is available as index
-            if 'timestamp' in df.columns:
-                if not np.issubdtype(df['timestamp'].dtype, np.datetime64) and not np.issubdtype(df['timestamp'].dtype, np.number):
-                     df['timestamp'] = pd.to_datetime(df['timestamp'])
-                df = df.set_index('timestamp')
-            
-            # Construct data frame with expected columns
-            data = pd.DataFrame({
-                'x': df['x'],
-                'y': df['y'],
-                'vol_x': df['vol_x'] if 'vol_x' in df.columns else 0,
-                'vol_y': df['vol_y'] if 'vol_y' in df.columns else 0
-            })
-            return data.sort_index()
-        # ---------------------------------------------------------------------
-        
+            return df
+
         # Map common aliases to standard names
         # Price Aliases
         if 'close' in df.columns and 'price' not in df.columns:
@@ -103,7 +967,39 @@ class QuantEngine:
             df = df.rename(columns={'time': 'timestamp'})
         if 'datetime' in df.columns and 'timestamp' not in df.columns:
             df = df.rename(columns={'datetime': 'timestamp'})
+        return df
+
+    @staticmethod
+    def prepare_aligned_data(df: pd.DataFrame, sym_x: str, sym_y: str, tolerance=None, freq=None):
+        """
+        Aligns prices by timestamp with a one-pass as-of merge (see asof_align).
+        tolerance / freq accept Timedelta-like values for datetime timestamps.
+        Returns clean dataframe with 'x', 'y', 'vol_x' and 'vol_y' columns.
+        """
+        if df.empty: return pd.DataFrame()
+
+        # Normalize headers and map common aliases (shared with the chunked CSV importer)
+        df = QuantEngine.normalize_columns(df)
+        
+        # --- NEW: Handle Pre-Aligned / Analytics Export Data (Wide Format) ---
+        # If the file already contains 'x' and 'y' columns (like the statarb_analytics.csv)
+        if {'x', 'y'}.issubset(df.columns):
+            # Ensure timestamp is available as index
+            if 'timestamp' in df.columns:
+                if not np.issubdtype(df['timestamp'].dtype, np.datetime64) and not np.issubdtype(df['timestamp'].dtype, np.number):
+                     df['timestamp'] = pd.to_datetime(df['timestamp'])
+                df = df.set_index('timestamp')
             
+            # Construct data frame with expected columns
+            data = pd.DataFrame({
+                'x': df['x'],
+                'y': df['y'],
+                'vol_x': df['vol_x'] if 'vol_x' in df.columns else 0,
+                'vol_y': df['vol_y'] if 'vol_y' in df.columns else 0
+            })
+            return data.sort_index()
+        # ---------------------------------------------------------------------
+        
         # Validate required columns
         required_cols = {'timestamp', 'symbol', 'price'}
         if not required_cols.issubset(df.columns):
@@ -111,46 +1007,72 @@ class QuantEngine:
             # print(f"Missing columns: {required_cols - set(df.columns)}")
             return pd.DataFrame()
         
-        # Ensure timestamp is datetime
-        if not np.issubdtype(df['timestamp'].dtype, np.datetime64) and not np.issubdtype(df['timestamp'].dtype, np.number):
+        # Ensure timestamp is datetime (tz-aware allowed)
+        if not pd.api.types.is_datetime64_any_dtype(df['timestamp']) and not pd.api.types.is_numeric_dtype(df['timestamp']):
              df['timestamp'] = pd.to_datetime(df['timestamp'])
 
-        pivot = df.pivot_table(index='timestamp', columns='symbol', values='price')
-        
-        # --- NEW: Capture Volume for Liquidity Profile ---
-        # Check for 'size' or 'volume' column
+        # Check for 'size' or 'volume' column (Liquidity Profile)
         vol_col = None
         if 'size' in df.columns: vol_col = 'size'
         elif 'volume' in df.columns: vol_col = 'volume'
         elif 'qty' in df.columns: vol_col = 'qty'
-        
-        if vol_col:
-            vol_pivot = df.pivot_table(index='timestamp', columns='symbol', values=vol_col, aggfunc='sum')
-            vol_pivot = vol_pivot.fillna(0)
-        else:
-            vol_pivot = pd.DataFrame()
-        # -------------------------------------------------
 
-        pivot = pivot.ffill().dropna()
-        
         # Critical Check: Ensure selected symbols exist in the data
-        if sym_x not in pivot.columns or sym_y not in pivot.columns:
+        symbols = df['symbol'].to_numpy()
+        mask_x, mask_y = symbols == sym_x, symbols == sym_y
+        if not mask_x.any() or not mask_y.any():
             # This is a common failure point if the CSV symbols don't match the Sidebar selection
             return pd.DataFrame()
-            
-        data = pd.DataFrame({
-            'x': pivot[sym_x],
-            'y': pivot[sym_y],
-            'vol_x': vol_pivot[sym_x] if not vol_pivot.empty and sym_x in vol_pivot.columns else 0,
-            'vol_y': vol_pivot[sym_y] if not vol_pivot.empty and sym_y in vol_pivot.columns else 0
-        })
-        return data
+
+        # Datetimes are aligned as int64 nanoseconds, numeric timestamps as-is
+        ts = df['timestamp']
+        numeric = pd.api.types.is_numeric_dtype(ts)
+        if numeric:
+            keys = ts.to_numpy(dtype=np.float64)
+        else:
+            idx = pd.DatetimeIndex(ts).as_unit('ns')
+            tz = idx.tz
+            keys = idx.asi8
+            tolerance = None if tolerance is None else pd.Timedelta(tolerance).value
+            freq = None if freq is None else pd.Timedelta(freq).value
+        price = df['price'].to_numpy(dtype=np.float64)
+        vol = df[vol_col].to_numpy(dtype=np.float64) if vol_col else None
+
+        t, x, y, vol_x, vol_y = asof_align(
+            keys[mask_x], price[mask_x], None if vol is None else vol[mask_x],
+            keys[mask_y], price[mask_y], None if vol is None else vol[mask_y],
+            tolerance=tolerance, freq=freq
+        )
+        if numeric:
+            index = pd.Index(t, name='timestamp')
+        else:
+            index = pd.DatetimeIndex(t.view('M8[ns]'), name='timestamp')
+            if tz is not None:
+                index = index.tz_localize('UTC').tz_convert(tz)
+        return pd.DataFrame({'x': x, 'y': y, 'vol_x': vol_x, 'vol_y': vol_y}, index=index)
+
+    @staticmethod
+    def align_tick_arrays(x, y, tolerance=None, freq=None):
+        """
+        Array counterpart of prepare_aligned_data for time-ordered per-symbol
+        ticks (e.g. TradeStore.get_tick_arrays), skipping long-format frames.
+        x / y: (timestamp, price, size) with epoch-second timestamps;
+        tolerance / freq in seconds (see asof_align).
+        """
+        if x is None or y is None or not len(x[0]) or not len(y[0]):
+            return pd.DataFrame()
+        t, px, py, vol_x, vol_y = asof_align(*x, *y, tolerance=tolerance, freq=freq)
+        return pd.DataFrame(
+            {'x': px, 'y': py, 'vol_x': vol_x, 'vol_y': vol_y},
+            index=pd.DatetimeIndex(pd.to_datetime(t, unit='s'), name='timestamp')
+        )
 
     @staticmethod
-    def calculate_metrics(df: pd.DataFrame, window=20, method='OLS'):
+    def calculate_metrics(df: pd.DataFrame, window=20, method='OLS', delta=1e-4, R=1e-3):
         """
         Core analytics pipeline.
         Calculates Spread, Z-Score, and Rolling Beta.
+        delta / R are the Kalman process / measurement noise (Kalman only).
         """
         # MODIFIED: Allow returning partial dataframe for progressive loading
         if len(df) < window:
@@ -173,38 +1095,38 @@ class QuantEngine:
             df['spread'] = df['y'] - (df['beta'] * df['x'] + df['alpha'])
             
         elif method == 'Kalman':
-            # Apply Kalman Filter Iteratively
-            kf = KalmanFilterReg()
-            betas = []
-            alphas = []
-            
-            for i in range(len(df)):
-                slope, intercept = kf.update(df['x'].iloc[i], df['y'].iloc[i])
-                betas.append(slope)
-                alphas.append(intercept)
+            # Apply Kalman Filter over the whole frame in one tight loop
+            kf = KalmanFilterReg(delta, R)
+            betas, alphas = kf.filter(df['x'].to_numpy(), df['y'].to_numpy())
                 
             df['beta'] = betas
             df['alpha'] = alphas
             df['spread'] = df['y'] - (df['beta'] * df['x'] + df['alpha'])
 
         elif method == 'Robust (Huber)':
-            # --- NEW: Robust Regression (Rolling Median/Theil-Sen Proxy) ---
-            df['beta'] = (df['y'] / df['x']).rolling(window=window).median()
-            
-            rolling_median_y = df['y'].rolling(window=window).median()
-            rolling_median_x = df['x'].rolling(window=window).median()
-            df['alpha'] = rolling_median_y - df['beta'] * rolling_median_x
+            # Rolling Huber regression (IRLS), each window centred on its rolling medians
+            # (same RollingQuantile the live RollingHuber uses)
+            x = df['x'].to_numpy(dtype=float)
+            y = df['y'].to_numpy(dtype=float)
+            df['beta'], df['alpha'] = rolling_huber(
+                x, y, RollingQuantile(window).catch_up(x), RollingQuantile(window).catch_up(y), window
+            )
             df['spread'] = df['y'] - (df['beta'] * df['x'] + df['alpha'])
 
         # 2. Z-Score Calculation
-        roll_mean = df['spread'].rolling(window=window).mean()
-        roll_std = df['spread'].rolling(window=window).std()
-        
-        # Handle division by zero (rare but possible in flat markets)
-        df['z_score'] = (df['spread'] - roll_mean) / (roll_std + 1e-8)
+        df['z_score'] = QuantEngine.spread_zscore(df['spread'], window)
         
         return df # Do not dropna here to allow viewing prices while Z-score calibrates
 
+    @staticmethod
+    def spread_zscore(spread: pd.Series, window=20) -> pd.Series:
+        """Rolling z-score of a spread series (shared by calculate_metrics and the parameter sweep)."""
+        roll_mean = spread.rolling(window=window).mean()
+        roll_std = spread.rolling(window=window).std()
+        
+        # Handle division by zero (rare but possible in flat markets)
+        return (spread - roll_mean) / (roll_std + 1e-8)
+
     @staticmethod
     def resample_data(df: pd.DataFrame, rule='1min'):
         """
@@ -222,6 +1144,44 @@ class QuantEngine:
 
         return df.resample(rule).agg(agg_dict).dropna()
 
+    @staticmethod
+    def resample_model_stats(df: pd.DataFrame, rule='1min'):
+        """Per-bar spread mean and last z-score / beta of an analytics frame."""
+        agg_dict = {}
+        if 'spread' in df.columns: agg_dict['spread'] = 'mean'
+        if 'z_score' in df.columns: agg_dict['z_score'] = 'last'
+        if 'beta' in df.columns: agg_dict['beta'] = 'last'
+        if df.empty or not agg_dict: return pd.DataFrame()
+
+        return df[list(agg_dict)].resample(rule).agg(agg_dict)
+
+    @staticmethod
+    def pair_bars(bars: pd.DataFrame, sym_x: str, sym_y: str):
+        """
+        Wide x/y view of storage OHLCV bars (TradeStore.get_bars):
+        close as x/y, plus per-leg VWAP, volume and trade count.
+        """
+        if bars.empty: return pd.DataFrame()
+
+        wide = bars.pivot(columns='symbol', values=['close', 'vwap', 'volume', 'trades'])
+        legs = wide.columns.get_level_values(1)
+        if sym_x not in legs or sym_y not in legs:
+            return pd.DataFrame()
+
+        data = pd.DataFrame({
+            'x': wide[('close', sym_x)],
+            'y': wide[('close', sym_y)],
+            'vwap_x': wide[('vwap', sym_x)],
+            'vwap_y': wide[('vwap', sym_y)],
+            'vol_x': wide[('volume', sym_x)].fillna(0),
+            'vol_y': wide[('volume', sym_y)].fillna(0),
+            'trades_x': wide[('trades', sym_x)].fillna(0),
+            'trades_y': wide[('trades', sym_y)].fillna(0),
+        })
+        # A quiet leg has no bar for that interval: carry its last close forward
+        data[['x', 'y']] = data[['x', 'y']].ffill()
+        return data.dropna(subset=['x', 'y']).astype(float)
+
     @staticmethod
     def run_stationarity_test(spread_series):
         """Performs Augmented Dickey-Fuller Test."""
@@ -234,7 +1194,9 @@ class QuantEngine:
             return {
                 'adf_stat': result[0],
                 'p_value': result[1],
-                'is_stationary': result[1] < 0.05
+                'is_stationary': result[1] < 0.05,
+                'lag': result[2],
+                'n_obs': result[3]
             }
         except:
             return None
@@ -250,40 +1212,47 @@ class QuantEngine:
         df = df.copy().dropna(subset=['z_score'])
         if df.empty: return None
 
-        df['position'] = 0
-        
-        # Vectorized Signal Logic (Simplified)
         # 1 = Long Spread (Long Y, Short X)
         # -1 = Short Spread (Short Y, Long X)
-        
-        # Entry
-        df.loc[df['z_score'] < -entry_z, 'position'] = 1
-        df.loc[df['z_score'] > entry_z, 'position'] = -1
-        
-        # Fill forward positions until exit condition is met (Stateful, harder to pure vectorize)
-        # We do a simple approach: Carry forward position if abs(z) > exit_z
-        # This is an approximation for visualization
-        
-        positions = np.zeros(len(df))
-        current_pos = 0
-        
-        z = df['z_score'].values
-        
-        for i in range(1, len(df)):
-            if z[i] > entry_z:
-                current_pos = -1 # Short spread
-            elif z[i] < -entry_z:
-                current_pos = 1 # Long spread
-            elif (current_pos == 1 and z[i] >= exit_z) or (current_pos == -1 and z[i] <= -exit_z):
-                current_pos = 0 # Exit
-            
-            positions[i] = current_pos
-            
-        df['position'] = positions
+        df['position'] = backtest_positions(df['z_score'].to_numpy(), entry_z, exit_z).astype(np.float64)
         
         # Calculate PnL: Position * Change in Spread
         df['spread_ret'] = df['spread'].diff()
         df['pnl'] = df['position'].shift(1) * df['spread_ret']
         df['cum_pnl'] = df['pnl'].cumsum()
         
-        return df
\ No newline at end of file
+        return df
+
+    @staticmethod
+    def run_backtest_batch(df: pd.DataFrame, pairs) -> pd.DataFrame:
+        """
+        run_backtest for many (entry_z, exit_z) pairs at once, reduced to the
+        dashboard's summary: final PnL, position flips (as counted on the
+        Backtest tab) and max drawdown of cumulative PnL.
+        Returns one row per pair, indexed by (entry_z, exit_z).
+        """
+        pairs = np.asarray(list(pairs), dtype=np.float64).reshape(-1, 2)
+        index = pd.MultiIndex.from_arrays([pairs[:, 0], pairs[:, 1]], names=['entry_z', 'exit_z'])
+        out = np.full((len(pairs), 3), np.nan)
+        out[:, 1] = 0
+
+        if 'z_score' in df.columns and len(pairs):
+            valid = df['z_score'].notna().to_numpy()
+            z = df['z_score'].to_numpy(dtype=np.float64)[valid]
+            spread_ret = np.diff(df['spread'].to_numpy(dtype=np.float64)[valid])
+            n = len(z)
+            step = max(1, BACKTEST_BATCH_CELLS // max(n, 1))
+            for k in range(0, len(pairs) if n else 0, step):
+                pos = backtest_positions(z, pairs[k:k + step, 0], pairs[k:k + step, 1])
+                # pnl[i] = position[i-1] * spread_ret[i]; NaN steps add nothing, so the
+                # running sum carries the last value forward over them (as run_backtest's cumsum)
+                pnl = pos[:, :-1] * spread_ret
+                cum = np.cumsum(np.where(np.isnan(pnl), 0.0, pnl), axis=1)
+                cum = np.concatenate([np.zeros((len(pos), 1)), cum], axis=1)
+                out[k:k + step, 0] = cum[:, -1]
+                out[k:k + step, 1] = 1 + np.count_nonzero(np.diff(pos, axis=1), axis=1)
+                out[k:k + step, 2] = (np.maximum.accumulate(cum, axis=1) - cum).max(axis=1)
+
+        result = pd.DataFrame(out, index=index, columns=BACKTEST_SUMMARY_COLUMNS)
+        result['flips'] = result['flips'].astype(int)
+        return result
\ No newline at end of file
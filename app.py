@@ -2,15 +2,20 @@
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import time
 from datetime import datetime
 
 # Internal imports
 import config
 from storage import TradeStore
-from ingest import BinanceStreamer
-from analytics import QuantEngine
+from ingest import create_streamer
+from analytics import QuantEngine, MetricsSession, AnalyticsCache, StationarityMonitor
+from latency import STAGES
+from archive import start_compaction_thread
+from importer import import_csv
+from scanner import load_latest_scan
+from sweep import run_sweep, sweep_heatmap
+from charts import PairChart, scatter_type
 
 # --- 1. PRO UI CONFIGURATION ---
 st.set_page_config(
@@ -112,12 +117,49 @@ st.markdown("""
 @st.cache_resource
 def get_system_components():
     store = TradeStore()
-    streamer = BinanceStreamer(store)
+    streamer = create_streamer(store)
     streamer.start()
+    if store.archive is not None:
+        start_compaction_thread(store, store.archive)
     return store, streamer
 
 store, streamer = get_system_components()
 
+@st.cache_resource(max_entries=32)
+def get_metrics_session(sym_x, sym_y, window, method, delta, R):
+    # One streaming analytics state per pair and parameter set, shared across reruns
+    return MetricsSession(window, method, delta, R)
+
+@st.cache_resource(max_entries=32)
+def get_stationarity_monitor(source, sym_x, sym_y, window, method, delta, R, mode):
+    # Cached ADF state per spread series; re-tests on a cadence instead of every rerun
+    return StationarityMonitor(mode, config.ADF_FAST_LAG, config.ADF_MIN_INTERVAL_S, config.ADF_MIN_NEW_SAMPLES)
+
+@st.cache_resource
+def get_analytics_cache():
+    # Results keyed on (data version, pair, parameters): idle reruns are lookups
+    return AnalyticsCache(config.ANALYTICS_CACHE_ENTRIES, config.ANALYTICS_CACHE_MB << 20)
+
+analytics_cache = get_analytics_cache()
+
+def load_upload(uploaded_file, sym_x, sym_y):
+    # Chunked import (aligned pair only); reused across reruns until the file or pair changes,
+    # so model parameters are recomputed from memory instead of re-reading the CSV
+    key = (getattr(uploaded_file, 'file_id', uploaded_file.name), sym_x, sym_y)
+    cache = st.session_state.setdefault('upload_cache', {})
+    if key not in cache:
+        bar = st.progress(0.0, text="Importing CSV...")
+        uploaded_file.seek(0)
+        result, stats = import_csv(
+            uploaded_file, sym_x, sym_y, method=None,
+            progress=lambda f: bar.progress(f, text=f"Importing CSV... {f:.0%}")
+        )
+        bar.empty()
+        st.session_state['upload_stats'] = stats
+        cache.clear()
+        cache[key] = result
+    return cache[key]
+
 # --- 4. SIDEBAR CONTROLS & HEALTH ---
 with st.sidebar:
     st.title("⚡ AlphaStream")
@@ -155,22 +197,78 @@ with st.sidebar:
         
         # Added Robust Option
         calc_method = st.radio("Model", ["OLS (Static)", "Kalman (Dynamic)", "Robust (Huber)"], horizontal=False)
+        
+        kalman_delta, kalman_R = config.KALMAN_DELTA, config.KALMAN_R
+        if "Kalman" in calc_method:
+            kalman_delta = st.number_input("Kalman δ (Process Noise)", value=config.KALMAN_DELTA, min_value=1e-8, max_value=1.0, format="%.1e")
+            kalman_R = st.number_input("Kalman R (Measurement Noise)", value=config.KALMAN_R, min_value=1e-8, max_value=10.0, format="%.1e")
+
+    with st.expander("📈 Chart"):
+        chart_points = st.select_slider(
+            "Points per Trace", options=config.CHART_POINT_OPTIONS + ["Full"], value=config.CHART_MAX_POINTS,
+            help="Lines are downsampled with LTTB, bars with min/max buckets (threshold crossings always kept)"
+        )
+        chart_points = None if chart_points == "Full" else chart_points
 
 # --- 5. DATA INGESTION & ANALYTICS ---
 
+# Method Selection
+if "Kalman" in calc_method: method_key = "Kalman"
+elif "Robust" in calc_method: method_key = "Robust (Huber)"
+else: method_key = "OLS"
+
+live = data_source == "Live Stream"
+uploaded = data_source == "Historical Upload" and uploaded_file is not None
+
+def load_analytics():
+    """
+    (data_key, model_key, df_aligned, analytics_df) for the current data.
+    Used by the main run and by every fragment; all stages go through the
+    analytics cache, so fragments refreshing on the same data version share results.
+    """
+    # data_key identifies the data behind this run; with the model parameters it keys the analytics cache
+    if uploaded:
+        data_key = ('upload', getattr(uploaded_file, 'file_id', uploaded_file.name))
+        df_aligned = load_upload(uploaded_file, sym_x, sym_y)
+    else:
+        data_key = ('live',) + store.data_version([sym_x, sym_y])
+
+        def align_live():
+            # Per-symbol ring-buffer arrays straight into the aligner (no long-format frame)
+            tick_arrays, _ = store.get_tick_arrays([sym_x, sym_y])
+            return QuantEngine.align_tick_arrays(tick_arrays.get(sym_x), tick_arrays.get(sym_y))
+
+        df_aligned = analytics_cache.get(('aligned', data_key, sym_x, sym_y), align_live)
+    model_key = (data_key, sym_x, sym_y, window, method_key, kalman_delta, kalman_R)
+
+    # Uploads run the batch model once per parameter set; live models are advanced
+    # incrementally over new ticks only
+    if df_aligned.empty:
+        analytics_df = df_aligned
+    elif uploaded:
+        analytics_df = analytics_cache.get(('metrics',) + model_key, lambda: QuantEngine.calculate_metrics(
+            df_aligned, window, method_key, kalman_delta, kalman_R
+        ))
+    else:
+        session = get_metrics_session(sym_x, sym_y, window, method_key, kalman_delta, kalman_R)
+        analytics_df = analytics_cache.get(('metrics',) + model_key, lambda: session.advance(df_aligned))
+    return data_key, model_key, df_aligned, analytics_df
+
+def is_calibrated_frame(df):
+    # Calibration is complete once the latest Z-score exists and is not NaN
+    return 'z_score' in df.columns and not df['z_score'].iloc[-1:].isna().all()
+
 # Handle Data Source
-if data_source == "Historical Upload" and uploaded_file is not None:
+if uploaded:
     try:
-        raw_df = pd.read_csv(uploaded_file)
-        if 'timestamp' in raw_df.columns:
-            raw_df['timestamp'] = pd.to_datetime(raw_df['timestamp'])
+        data_key, model_key, df_aligned, analytics_df = load_analytics()
     except Exception as e:
         st.error(f"Error reading file: {e}")
         st.stop()
+elif live:
+    data_key, model_key, df_aligned, analytics_df = load_analytics()
 else:
-    raw_df = store.get_recent_ticks()
-
-df_aligned = QuantEngine.prepare_aligned_data(raw_df, sym_x, sym_y)
+    df_aligned = pd.DataFrame()
 
 # --- LOADING STATE ---
 if df_aligned.empty:
@@ -186,141 +284,118 @@ if df_aligned.empty:
         st.info("Please upload a CSV file.")
         st.stop()
 
-# Method Selection
-if "Kalman" in calc_method: method_key = "Kalman"
-elif "Robust" in calc_method: method_key = "Robust (Huber)"
-else: method_key = "OLS"
+# Refresh cadences: with live polling the KPI strip and the chart are fragments on their own
+# timers, the tabs refresh on a slower cadence (or on demand); nothing reruns the whole page
+kpi_every = config.REFRESH_RATE_MS / 1000.0 if live and auto_refresh else None
+chart_every = config.CHART_REFRESH_MS / 1000.0 if live and auto_refresh else None
+tab_every = config.TABS_REFRESH_S if live and auto_refresh else None
 
-# Run Calculation
-analytics_df = QuantEngine.calculate_metrics(df_aligned, window, method_key)
+def refresh_footer(key):
+    f1, f2 = st.columns([5, 1])
+    f1.caption(f"Updated {datetime.now():%H:%M:%S}" + (f" · refreshes every {tab_every:g}s" if tab_every else ""))
+    f2.button("↻ Refresh", key=key)
 
 # --- 6. KPI DASHBOARD ---
-# Check if calibration is complete (Z-score exists and not NaN)
-is_calibrated = 'z_score' in analytics_df.columns and not analytics_df['z_score'].iloc[-1:].isna().all()
+@st.fragment(run_every=kpi_every)
+def kpi_strip():
+    data_key, model_key, df_aligned, analytics_df = load_analytics()
+    if live:
+        store.record_consumption([sym_x, sym_y])
+    is_calibrated = is_calibrated_frame(analytics_df)
 
-if is_calibrated:
-    try:
-        last_row = analytics_df.iloc[-1]
-        curr_z = last_row['z_score']
-        curr_spread = last_row['spread']
-        curr_beta = last_row['beta']
+    if is_calibrated:
+        try:
+            last_row = analytics_df.iloc[-1]
+            curr_z = last_row['z_score']
+            curr_spread = last_row['spread']
+            curr_beta = last_row['beta']
         
-        raw_corr = analytics_df['x'].rolling(window).corr(analytics_df['y']).iloc[-1]
-        curr_corr = 0.0 if np.isnan(raw_corr) else raw_corr
+            raw_corr = analytics_cache.get(
+                ('corr', data_key, sym_x, sym_y, window),
+                lambda: analytics_df['x'].rolling(window).corr(analytics_df['y']).iloc[-1]
+            )
+            curr_corr = 0.0 if np.isnan(raw_corr) else raw_corr
         
-        prev_z = analytics_df['z_score'].iloc[-2] if len(analytics_df) > 1 else curr_z
-        z_delta = curr_z - prev_z
-
-        # Signal Logic
-        if curr_z > z_thresh:
-            sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-short", "⬇️", f"SHORT {sym_y}", f"Z ({curr_z:.2f}) > {z_thresh}"
-        elif curr_z < -z_thresh:
-            sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-long", "⬆️", f"LONG {sym_y}", f"Z ({curr_z:.2f}) < -{z_thresh}"
-        else:
-            sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-neutral", "⏸️", "NO SIGNAL", f"Z ({curr_z:.2f}) in range"
+            prev_z = analytics_df['z_score'].iloc[-2] if len(analytics_df) > 1 else curr_z
+            z_delta = curr_z - prev_z
+
+            # Signal Logic
+            if curr_z > z_thresh:
+                sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-short", "⬇️", f"SHORT {sym_y}", f"Z ({curr_z:.2f}) > {z_thresh}"
+            elif curr_z < -z_thresh:
+                sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-long", "⬆️", f"LONG {sym_y}", f"Z ({curr_z:.2f}) < -{z_thresh}"
+            else:
+                sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-neutral", "⏸️", "NO SIGNAL", f"Z ({curr_z:.2f}) in range"
             
-    except Exception as e:
-        is_calibrated = False
-else:
-    # Calibrating State
-    curr_z, curr_spread, curr_beta, curr_corr, z_delta = 0.0, 0.0, 0.0, 0.0, 0.0
-    sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-neutral", "⏳", "CALIBRATING", f"Need {window - len(df_aligned)} more ticks"
-
-# Layout: 2 Columns (Signal Left, Metrics Right)
-col_signal, col_kpi = st.columns([1.5, 3.5])
-
-with col_signal:
-    st.markdown(f"""
-        <div class="{sig_cls}">
-            <div class="big-signal-text">{sig_ico} {sig_txt}</div>
-            <div class="sub-signal-text">{sig_sub}</div>
-        </div>
-    """, unsafe_allow_html=True)
-
-with col_kpi:
-    k1, k2, k3, k4 = st.columns(4)
-    if is_calibrated:
-        k1.metric("Spread", f"{curr_spread:.5f}")
-        k2.metric("Beta (β)", f"{curr_beta:.3f}")
-        k3.metric("Z-Score", f"{curr_z:.2f}", delta=f"{z_delta:.2f}", delta_color="inverse")
-        k4.metric("Corr (ρ)", f"{curr_corr:.2f}")
+        except Exception as e:
+            is_calibrated = False
     else:
-        k1.metric("Spread", "---")
-        k2.metric("Beta (β)", "---")
-        k3.metric("Z-Score", "---")
-        k4.metric("Corr (ρ)", "---")
+        # Calibrating State
+        curr_z, curr_spread, curr_beta, curr_corr, z_delta = 0.0, 0.0, 0.0, 0.0, 0.0
+        sig_cls, sig_ico, sig_txt, sig_sub = "trade-signal-box signal-neutral", "⏳", "CALIBRATING", f"Need {window - len(df_aligned)} more ticks"
 
-# --- 7. PROFESSIONAL CHARTING (Plotly) ---
-# Create 4-pane chart (Price, Spread, Z-Score, Volume)
-fig = make_subplots(
-    rows=4, cols=1, 
-    shared_xaxes=True, 
-    vertical_spacing=0.10, 
-    row_heights=[0.35, 0.2, 0.2, 0.15], 
-    subplot_titles=(
-        f"Price Action ({sym_y} vs {sym_x})", 
-        "Spread Analysis", 
-        "Z-Score Signal",
-        "Liquidity Profile"
-    )
-)
+    # Layout: 2 Columns (Signal Left, Metrics Right)
+    col_signal, col_kpi = st.columns([1.5, 3.5])
 
-# Pane 1: Prices (Dual Axis)
-fig.add_trace(go.Scatter(x=analytics_df.index, y=analytics_df['y'], name=sym_y, line=dict(color='#00F0FF', width=2)), row=1, col=1)
-fig.add_trace(go.Scatter(x=analytics_df.index, y=analytics_df['x'], name=sym_x, line=dict(color='#FFA500', width=2), yaxis='y2'), row=1, col=1)
-
-if is_calibrated:
-    # Pane 2: Spread
-    fig.add_trace(go.Scatter(x=analytics_df.index, y=analytics_df['spread'], name="Spread", line=dict(color='#E0E0E0', width=1.5), fill='tozeroy', fillcolor='rgba(224, 224, 224, 0.05)'), row=2, col=1)
-    roll_mean = analytics_df['spread'].rolling(window=window).mean()
-    fig.add_trace(go.Scatter(x=analytics_df.index, y=roll_mean, name=f"MA({window})", line=dict(color='#888', width=1, dash='dot')), row=2, col=1)
-
-    # Pane 3: Z-Score
-    z_vals = analytics_df['z_score']
-    colors = ['#FF4B4B' if z > z_thresh else '#00FF7F' if z < -z_thresh else '#555' for z in z_vals]
-    fig.add_trace(go.Bar(x=analytics_df.index, y=z_vals, name="Z-Score", marker_color=colors), row=3, col=1)
-    fig.add_hline(y=z_thresh, line_dash="dash", line_color="rgba(255, 75, 75, 0.5)", row=3, col=1)
-    fig.add_hline(y=-z_thresh, line_dash="dash", line_color="rgba(0, 255, 127, 0.5)", row=3, col=1)
-
-# Pane 4: Volume (New)
-if 'vol_x' in analytics_df.columns:
-    fig.add_trace(go.Bar(x=analytics_df.index, y=analytics_df['vol_x'], name="Vol X", marker_color='#FFA500', opacity=0.5), row=4, col=1)
-    fig.add_trace(go.Bar(x=analytics_df.index, y=analytics_df['vol_y'], name="Vol Y", marker_color='#00F0FF', opacity=0.5), row=4, col=1)
-
-# Global Chart Layout Updates
-fig.update_layout(
-    height=900, 
-    template="plotly_dark",
-    paper_bgcolor='rgba(0,0,0,0)', 
-    plot_bgcolor='rgba(0,0,0,0)',
-    margin=dict(l=20, r=20, t=100, b=20), 
-    hovermode="x unified",
-    legend=dict(orientation="h", yanchor="bottom", y=1.12, xanchor="right", x=1, bgcolor='rgba(0,0,0,0)'),
-    yaxis2=dict(overlaying='y', side='right', showgrid=False, title=sym_x),
-    yaxis=dict(title=sym_y),
-    font=dict(family="Inter, sans-serif")
-)
+    with col_signal:
+        st.markdown(f"""
+            <div class="{sig_cls}">
+                <div class="big-signal-text">{sig_ico} {sig_txt}</div>
+                <div class="sub-signal-text">{sig_sub}</div>
+            </div>
+        """, unsafe_allow_html=True)
+
+    with col_kpi:
+        k1, k2, k3, k4 = st.columns(4)
+        if is_calibrated:
+            k1.metric("Spread", f"{curr_spread:.5f}")
+            k2.metric("Beta (β)", f"{curr_beta:.3f}")
+            k3.metric("Z-Score", f"{curr_z:.2f}", delta=f"{z_delta:.2f}", delta_color="inverse")
+            k4.metric("Corr (ρ)", f"{curr_corr:.2f}")
+        else:
+            k1.metric("Spread", "---")
+            k2.metric("Beta (β)", "---")
+            k3.metric("Z-Score", "---")
+            k4.metric("Corr (ρ)", "---")
+
+kpi_strip()
+
+# --- 7. PROFESSIONAL CHARTING (Plotly) ---
+@st.fragment(run_every=chart_every)
+def main_chart():
+    _, _, _, analytics_df = load_analytics()
+    # 4-pane chart (Price, Spread, Z-Score, Volume), built once per session and updated in place
+    pair_chart = st.session_state.setdefault('pair_chart', PairChart())
+    fig = pair_chart.update(analytics_df, sym_x, sym_y, window, z_thresh, is_calibrated_frame(analytics_df), chart_points)
 
-# Remove gridlines for cleaner look on lower subplots
-fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='#333', row=1, col=1)
-fig.update_yaxes(showgrid=False, row=2, col=1)
-fig.update_yaxes(showgrid=False, row=3, col=1)
-fig.update_yaxes(showgrid=False, row=4, col=1)
+    st.plotly_chart(fig, use_container_width=True)
+    chart_payload = pair_chart.measure_payload()
+    st.caption(
+        f"Chart payload: {chart_payload / 1024:,.0f} KB · {pair_chart.points:,} points "
+        f"(from {len(analytics_df):,} rows, cap {chart_points or 'none'} per trace)"
+    )
 
-st.plotly_chart(fig, use_container_width=True)
+main_chart()
 
 # --- 8. DETAILED ANALYSIS TABS ---
-t1, t2, t3 = st.tabs(["📊 Performance Backtest", "📋 Resampled Stats (1m)", "🔍 Market Data Inspection"])
+t1, t2, t3, t4, t5 = st.tabs(["📊 Performance Backtest", "📋 Resampled Stats (1m)", "🔍 Market Data Inspection", "⏱️ Diagnostics", "🔎 Pair Scanner"])
 
-with t1:
+@st.fragment(run_every=tab_every)
+def backtest_tab():
+    data_key, model_key, df_aligned, analytics_df = load_analytics()
+    is_calibrated = is_calibrated_frame(analytics_df)
     if is_calibrated:
         st.markdown("##### In-Sample Session Backtest")
-        bt_df = QuantEngine.run_backtest(analytics_df, z_thresh, exit_thresh)
+        # Threshold changes reuse the cached metrics (spread / z-score) and only redo the backtest
+        bt_df = analytics_cache.get(
+            ('backtest',) + model_key + (z_thresh, exit_thresh),
+            lambda: QuantEngine.run_backtest(analytics_df, z_thresh, exit_thresh)
+        )
         
         if bt_df is not None:
             bc1, bc2 = st.columns([3, 1])
             with bc1:
-                fig_bt = go.Figure(go.Scatter(x=bt_df.index, y=bt_df['cum_pnl'], fill='tozeroy', line=dict(color='#00FF7F', width=2), name="Cumulative PnL"))
+                fig_bt = go.Figure(scatter_type(len(bt_df))(x=bt_df.index, y=bt_df['cum_pnl'], fill='tozeroy', line=dict(color='#00FF7F', width=2), name="Cumulative PnL"))
                 fig_bt.update_layout(height=250, template="plotly_dark", margin=dict(l=0,r=0,t=10,b=0), paper_bgcolor='rgba(0,0,0,0)')
                 st.plotly_chart(fig_bt, use_container_width=True)
             with bc2:
@@ -329,23 +404,70 @@ with t1:
                 trade_count = len(bt_df[bt_df['position'].diff() != 0])
                 st.metric("Session PnL", f"{total_pnl:.4f}")
                 st.metric("Signal Flips", f"{trade_count}")
+
+        with st.expander("🧪 Parameter Sweep"):
+            sw1, sw2, sw3, sw4 = st.columns(4)
+            sweep_windows = sw1.multiselect("Windows", [20, 50, 100, 150, 200, 300, 500], default=[50, 100, 200])
+            sweep_entries = sw2.multiselect("Entry Z", [1.0, 1.5, 2.0, 2.5, 3.0, 3.5], default=[1.5, 2.0, 2.5])
+            sweep_exits = sw3.multiselect("Exit Z", [0.0, 0.25, 0.5, 0.75], default=[0.0, 0.5])
+            sweep_methods = sw4.multiselect("Models", ["OLS", "Kalman", "Robust (Huber)"], default=[method_key])
+            if st.button("Run Sweep") and sweep_windows and sweep_entries and sweep_exits and sweep_methods:
+                sweep_bar = st.progress(0.0, text="Sweeping...")
+                st.session_state['sweep_results'] = run_sweep(
+                    df_aligned, sweep_windows, sweep_entries, sweep_exits, sweep_methods, kalman_delta, kalman_R,
+                    progress=lambda f: sweep_bar.progress(f, text=f"Sweeping... {f:.0%}")
+                )
+                sweep_bar.empty()
+
+            sweep_results = st.session_state.get('sweep_results')
+            if sweep_results is not None and not sweep_results.empty:
+                hm1, hm2, hm3 = st.columns(3)
+                hm_metric = hm1.selectbox("Metric", ['pnl', 'flips', 'max_drawdown'])
+                hm_method = hm2.selectbox("Model", list(sweep_results.index.unique('method')))
+                hm_exit = hm3.selectbox("Exit Z", list(sweep_results.index.unique('exit_z')), key="sweep_heatmap_exit")
+                st.plotly_chart(sweep_heatmap(sweep_results, hm_metric, hm_method, hm_exit), use_container_width=True)
+                st.dataframe(sweep_results.sort_values('pnl', ascending=False).head(10), use_container_width=True)
     else:
         st.info("Waiting for calibration for backtest...")
+    refresh_footer("refresh_backtest")
 
-with t2:
+@st.fragment(run_every=tab_every)
+def stats_tab():
+    data_key, model_key, df_aligned, analytics_df = load_analytics()
     st.markdown("##### 1-Minute Aggregated Statistics")
-    if not analytics_df.empty:
-        resampled_df = QuantEngine.resample_data(analytics_df, '1min')
+    if data_source == "Live Stream":
+        # Prices/volume come straight from the storage bar tables (O(bars)); model stats from the live frame
+        resampled_df = QuantEngine.pair_bars(store.get_bars([sym_x, sym_y], '1m', limit=config.RESAMPLED_TABLE_BARS), sym_x, sym_y)
+        model_stats = analytics_cache.get(
+            ('model_stats',) + model_key, lambda: QuantEngine.resample_model_stats(analytics_df, '1min')
+        )
+        if not resampled_df.empty and not model_stats.empty:
+            resampled_df = resampled_df.join(model_stats)
+    else:
+        resampled_df = analytics_cache.get(('resampled',) + model_key, lambda: QuantEngine.resample_data(analytics_df, '1min'))
+    if not resampled_df.empty:
         st.dataframe(resampled_df.style.format("{:.4f}"), use_container_width=True)
         st.download_button("Download 1-Min Data (CSV)", resampled_df.to_csv().encode('utf-8'), "statarb_1min.csv", "text/csv")
+    refresh_footer("refresh_stats")
 
-with t3:
+@st.fragment(run_every=tab_every)
+def inspection_tab():
+    data_key, model_key, df_aligned, analytics_df = load_analytics()
+    is_calibrated = is_calibrated_frame(analytics_df)
     col_insp_1, col_insp_2 = st.columns([1, 2])
     
     with col_insp_1:
         st.markdown("##### Stationarity (ADF Test)")
+        adf_fast = st.toggle(f"Fast mode (fixed lag {config.ADF_FAST_LAG})", value=config.ADF_MODE == "fast")
         if is_calibrated:
-            adf_res = QuantEngine.run_stationarity_test(analytics_df['spread'])
+            source = data_key if data_key[0] == 'upload' else ('live',)
+            monitor = get_stationarity_monitor(
+                source, sym_x, sym_y, window, method_key, kalman_delta, kalman_R, "fast" if adf_fast else "full"
+            )
+            generation = None if uploaded else get_metrics_session(
+                sym_x, sym_y, window, method_key, kalman_delta, kalman_R
+            ).generation
+            adf_res = monitor.update(analytics_df['spread'], generation=generation)
             if adf_res:
                 is_stat = adf_res['is_stationary']
                 stat_color = "green" if is_stat else "red"
@@ -354,6 +476,7 @@ with t3:
                 <div style="background-color: #1a1c24; padding: 10px; border-radius: 5px; border-left: 4px solid {stat_color};">
                     <strong style="color: {stat_color}">{stat_msg}</strong>
                     <br><span style="font-size: 0.9em; color: #888">p-value: {adf_res['p_value']:.4f}</span>
+                    <br><span style="font-size: 0.8em; color: #666">n = {adf_res['samples']:,} samples · lag {adf_res['lag']} · {adf_res['age_s']:.0f}s ago</span>
                 </div>
                 """, unsafe_allow_html=True)
             else:
@@ -368,8 +491,79 @@ with t3:
             st.dataframe(analytics_df.tail(5), use_container_width=True)
         
         st.download_button("Download Tick Data (CSV)", analytics_df.to_csv().encode('utf-8'), "statarb_ticks.csv", "text/csv")
+    refresh_footer("refresh_inspection")
+
+@st.fragment(run_every=tab_every)
+def diagnostics_tab():
+    st.markdown("##### Pipeline Latency (Exchange → Rendered Signal)")
+    lat_stats = store.get_latency_stats()
+    if lat_stats:
+        lat_df = pd.DataFrame.from_dict(lat_stats, orient='index')
+        lat_df.insert(0, 'stage', [STAGES[k] for k in lat_df.index])
+        st.dataframe(
+            lat_df[['stage', 'count', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'negative']].style.format(
+                {'p50_ms': "{:.2f}", 'p90_ms': "{:.2f}", 'p99_ms': "{:.2f}", 'max_ms': "{:.2f}"}
+            ),
+            use_container_width=True, hide_index=True
+        )
+        st.caption("Exchange-relative stages include clock skew between Binance and this host; 'negative' counts samples clamped to 0.")
+        if st.button("Reset Latency Stats"):
+            store.reset_latency_stats()
+    else:
+        st.info("Latency tracking is disabled (config.LATENCY_TRACKING).")
+
+    st.markdown("##### Disk Writer")
+    w_stats = store.get_writer_stats()
+    d1, d2, d3, d4 = st.columns(4)
+    d1.metric("Queue Depth", f"{w_stats['queue_depth']}")
+    d2.metric("Avg Batch", f"{w_stats['avg_batch_size']:.0f}")
+    d3.metric("Avg Commit", f"{w_stats['avg_commit_ms']:.2f} ms")
+    d4.metric("Dropped", f"{w_stats['dropped']}")
+    st.caption(f"{w_stats['rows_written']:,} rows persisted · {w_stats['rows_ignored']:,} duplicates ignored · {w_stats['errors']} failed batches")
+
+    st.markdown("##### Chart Rendering")
+    ch_stats = st.session_state['pair_chart'].stats()
+    r1, r2, r3, r4 = st.columns(4)
+    r1.metric("Build (last)", f"{ch_stats['last_ms']:.1f} ms")
+    r2.metric("Build (avg)", f"{ch_stats['avg_ms']:.1f} ms")
+    r3.metric("Payload", f"{ch_stats['payload_kb']:,.0f} KB")
+    r4.metric("Line Mode", "WebGL" if ch_stats['webgl'] else "SVG")
+    st.caption(f"{ch_stats['points']:,} points shipped; figure rebuilt {ch_stats['rebuilds']} times this session.")
 
-# --- 9. AUTO REFRESH LOOP ---
-if auto_refresh and data_source == "Live Stream":
-    time.sleep(config.REFRESH_RATE_MS / 1000.0)
-    st.rerun()
\ No newline at end of file
+    up_stats = st.session_state.get('upload_stats')
+    if data_source == "Historical Upload" and up_stats:
+        st.caption(f"CSV import: {up_stats['rows']:,} rows in {up_stats['chunks']} chunks → {up_stats['aligned_rows']:,} aligned")
+
+    c_stats = analytics_cache.stats()
+    st.caption(
+        f"Analytics cache: {c_stats['entries']} entries, {c_stats['mb']:.1f} MB, "
+        f"{c_stats['hit_rate']:.0%} hit rate ({c_stats['hits']} hits / {c_stats['misses']} misses)"
+    )
+    refresh_footer("refresh_diagnostics")
+
+@st.fragment(run_every=tab_every)
+def scanner_tab():
+    scan_df = load_latest_scan(store.db_name)
+    if scan_df.empty:
+        st.info("No scan results yet. Run `python scanner.py` alongside the dashboard to rank every pair of config.SYMBOLS.")
+    else:
+        st.markdown(f"##### Cointegration Ranking ({pd.to_datetime(scan_df.attrs['bucket'], unit='s')} UTC bucket)")
+        st.dataframe(
+            scan_df.style.format({
+                'corr': "{:.3f}", 'beta': "{:.4f}", 'alpha': "{:.4f}",
+                'half_life': "{:.1f}", 'adf_stat': "{:.2f}", 'adf_p': "{:.4f}"
+            }),
+            use_container_width=True, hide_index=True
+        )
+        st.caption(f"y regressed on x over the last {config.SCANNER_LOOKBACK_BARS} {config.SCANNER_INTERVAL} bars; half-life in bars.")
+
+with t1:
+    backtest_tab()
+with t2:
+    stats_tab()
+with t3:
+    inspection_tab()
+with t4:
+    diagnostics_tab()
+with t5:
+    scanner_tab()
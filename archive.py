@@ -0,0 +1,282 @@
+﻿"""
+Cold-storage tier for historical ticks.
+Closed (UTC) days are rolled out of the SQLite `trades` table into compressed
+Parquet files partitioned per symbol and day:
+
+    <db name>_archive/symbol=BTCUSDT/date=2024-01-01.parquet
+
+Each SQLite file has its own archive next to it (see archive_dir). A manifest
+records min/max timestamp and row count for every partition, so reads prune
+partitions without opening files and project only the requested columns.
+Several processes (the dashboard's compactor, the CLI) may share an archive:
+writes hold a file lock and merge into the manifest on disk, and readers
+reload it when it changes. TradeStore.query reads the archive first, then
+the hot SQLite rows.
+
+Usage:
+    python archive.py compact            # roll every closed day into the archive
+    python archive.py list               # show partitions
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DAY_SECONDS = 86400
+
+def archive_dir(db_name):
+    """Archive root for a SQLite file: 'data/ticks.db' -> 'data/ticks_archive'."""
+    return os.path.splitext(db_name)[0] + config.ARCHIVE_DIR_SUFFIX
+
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock on `path` (created if missing)."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class TickArchive:
+    """Per-symbol/per-day Parquet archive with a JSON partition manifest."""
+
+    STORED_COLUMNS = ('timestamp', 'price', 'size')
+
+    def __init__(self, root, compression=config.ARCHIVE_COMPRESSION):
+        self.root = root
+        self.compression = compression
+        self.lock = threading.Lock()
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.lock_path = os.path.join(root, "manifest.lock")
+        self.manifest = {}
+        self.manifest_stamp = None
+
+    # --- Manifest ---
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _refresh(self):
+        """Reload the manifest if another process (or thread) replaced it (call with self.lock held)."""
+        try:
+            st = os.stat(self.manifest_path)
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self.manifest_stamp:
+            self.manifest = self._load_manifest() if stamp is not None else {}
+            self.manifest_stamp = stamp
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+        st = os.stat(self.manifest_path)
+        self.manifest_stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def partitions(self, symbol=None, start=None, end=None):
+        """Manifest entries for `symbol` overlapping [start, end), oldest first."""
+        with self.lock:
+            self._refresh()
+            entries = list(self.manifest.values())
+        return sorted(
+            (e for e in entries
+             if (symbol is None or e['symbol'] == symbol)
+             and (start is None or e['max_ts'] >= start)
+             and (end is None or e['min_ts'] < end)),
+            key=lambda e: (e['symbol'], e['min_ts'])
+        )
+
+    def symbols(self):
+        with self.lock:
+            self._refresh()
+            return sorted({e['symbol'] for e in self.manifest.values()})
+
+    # --- Write path ---
+    def _partition_path(self, symbol, day):
+        return os.path.join(self.root, f"symbol={symbol}", f"date={day}.parquet")
+
+    def write_partition(self, symbol, day, timestamp, price, size):
+        """
+        Write (or merge into) one symbol/day partition. Rows are sorted by
+        timestamp and de-duplicated on it, matching the SQLite primary key.
+        The merge and the manifest update run under the archive's file lock.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self.lock, file_lock(self.lock_path):
+            return self._write_partition(symbol, day, timestamp, price, size)
+
+    def _write_partition(self, symbol, day, timestamp, price, size):
+        path = self._partition_path(symbol, day)
+        table = pa.table({'timestamp': timestamp, 'price': price, 'size': size})
+        if os.path.exists(path):
+            table = pa.concat_tables([pq.read_table(path), table])
+
+        ts = table['timestamp'].to_numpy()
+        order = np.argsort(ts, kind='stable')
+        ts_sorted = ts[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = ts_sorted[1:] != ts_sorted[:-1]
+        table = table.take(pa.array(order[keep]))
+
+        min_ts = float(table['timestamp'][0].as_py())
+        max_ts = float(table['timestamp'][-1].as_py())
+        table = table.replace_schema_metadata({
+            'symbol': symbol, 'date': day, 'min_ts': repr(min_ts), 'max_ts': repr(max_ts)
+        })
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression=self.compression, row_group_size=config.ARCHIVE_ROW_GROUP_SIZE)
+        os.replace(tmp, path)
+
+        # Merge into the manifest as it is on disk, not this process's copy
+        self._refresh()
+        self.manifest[f"{symbol}/{day}"] = {
+            'symbol': symbol, 'date': day, 'path': os.path.relpath(path, self.root),
+            'min_ts': min_ts, 'max_ts': max_ts, 'rows': table.num_rows,
+        }
+        self._save_manifest()
+        return table.num_rows
+
+    def compact(self, db_name, hot_days=config.ARCHIVE_HOT_DAYS, now=None):
+        """
+        Roll every closed day older than the `hot_days` most recent UTC days
+        out of SQLite into Parquet, deleting the archived rows from SQLite.
+        Deletes go by exact key in transactions of ARCHIVE_DELETE_CHUNK rows,
+        so the tick writer is never locked out for a whole day's delete.
+        Returns {(symbol, day): rows archived}.
+        """
+        now = time.time() if now is None else now
+        cutoff = (now // DAY_SECONDS - (hot_days - 1)) * DAY_SECONDS
+        archived = {}
+
+        conn = sqlite3.connect(db_name, timeout=30)
+        try:
+            symbols = [r[0] for r in conn.execute("SELECT DISTINCT symbol FROM trades")]
+            for sym in symbols:
+                row = conn.execute(
+                    "SELECT MIN(timestamp) FROM trades WHERE symbol = ? AND timestamp < ?", (sym, cutoff)
+                ).fetchone()
+                if row[0] is None:
+                    continue
+                day_start = (row[0] // DAY_SECONDS) * DAY_SECONDS
+                while day_start < cutoff:
+                    day_end = day_start + DAY_SECONDS
+                    rows = conn.execute(
+                        "SELECT timestamp, price, size FROM trades INDEXED BY idx_sym_ts "
+                        "WHERE symbol = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                        (sym, day_start, day_end)
+                    ).fetchall()
+                    if rows:
+                        ts, price, size = (np.array(col, dtype=np.float64) for col in zip(*rows))
+                        day = datetime.fromtimestamp(day_start, tz=timezone.utc).strftime("%Y-%m-%d")
+                        self.write_partition(sym, day, ts, price, size)
+                        # Only delete once the partition is safely on disk
+                        for lo in range(0, len(rows), config.ARCHIVE_DELETE_CHUNK):
+                            with conn:
+                                conn.executemany(
+                                    "DELETE FROM trades WHERE timestamp = ? AND symbol = ?",
+                                    ((r[0], sym) for r in rows[lo:lo + config.ARCHIVE_DELETE_CHUNK])
+                                )
+                        archived[(sym, day)] = len(rows)
+                        print(f"[Archive] {sym} {day}: {len(rows)} ticks archived")
+                    day_start = day_end
+        finally:
+            conn.close()
+        return archived
+
+    # --- Read path ---
+    def read(self, symbol, start=None, end=None, columns=('timestamp', 'price', 'size'),
+             chunk_size=config.QUERY_CHUNK_SIZE):
+        """
+        Yield {column: np.ndarray} chunks for one symbol in timestamp order.
+        Partitions are pruned via the manifest; only requested columns are read.
+        """
+        stored = [c for c in columns if c in self.STORED_COLUMNS]
+        filters = []
+        if start is not None:
+            filters.append(('timestamp', '>=', float(start)))
+        if end is not None:
+            filters.append(('timestamp', '<', float(end)))
+
+        for entry in self.partitions(symbol, start, end):
+            path = os.path.join(self.root, entry['path'])
+            # Filtering needs the timestamp column even if it is not projected
+            read_cols = stored if (not filters or 'timestamp' in stored) else stored + ['timestamp']
+            table = pq.read_table(path, columns=read_cols, filters=filters or None)
+            n = table.num_rows
+            if n == 0:
+                continue
+            arrays = {c: table[c].to_numpy() for c in stored}
+            for lo in range(0, n, chunk_size):
+                hi = min(lo + chunk_size, n)
+                chunk = {}
+                for col in columns:
+                    if col == 'symbol':
+                        chunk[col] = np.full(hi - lo, symbol, dtype=object)
+                    else:
+                        chunk[col] = arrays[col][lo:hi]
+                yield chunk
+
+def start_compaction_thread(store, archive, interval=config.ARCHIVE_COMPACT_INTERVAL_S):
+    """Background daemon that periodically rolls closed days out of the store's SQLite file."""
+    def loop():
+        while True:
+            try:
+                store.flush()
+                archive.compact(store.db_name)
+            except Exception as e:
+                print(f"[Archive Error] Compaction failed: {e}")
+            time.sleep(interval)
+
+    t = threading.Thread(target=loop, name="ArchiveCompactor", daemon=True)
+    t.start()
+    return t
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet archive tier for historical ticks")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_compact = sub.add_parser('compact', help="Roll closed days out of SQLite")
+    p_compact.add_argument('--db', default=config.DB_NAME)
+    p_compact.add_argument('--hot-days', type=int, default=config.ARCHIVE_HOT_DAYS)
+    p_list = sub.add_parser('list', help="List archived partitions")
+    p_list.add_argument('--db', default=config.DB_NAME)
+    args = parser.parse_args()
+
+    archive = TickArchive(archive_dir(args.db))
+    if args.cmd == 'compact':
+        archived = archive.compact(args.db, args.hot_days)
+        print(f"[Archive] {sum(archived.values())} ticks in {len(archived)} partitions archived")
+    else:
+        for e in archive.partitions():
+            print(f"{e['symbol']:<12} {e['date']}  rows={e['rows']:<10} {e['path']}")
+
+if __name__ == "__main__":
+    main()
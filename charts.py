@@ -0,0 +1,158 @@
+﻿"""
+Figure builder for the dashboard's four-pane pair chart
+(price, spread, z-score, volume).
+The subplot grid, layout, styling and traces are built once and kept per
+session; each rerun only swaps in the new downsampled arrays, bar colours
+and threshold lines. Lines switch to WebGL (Scattergl) when a trace
+carries more than CHART_WEBGL_THRESHOLD points.
+"""
+import time
+from collections import deque
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+import config
+from downsample import axis_values, lttb_indices, minmax_indices
+
+# Z-score bar palette by code: 0 neutral, 1 above +threshold (short), 2 below -threshold (long).
+# Bars carry the numeric code and this colorscale maps it exactly; plotly validates a
+# numeric array in one pass, where a per-bar colour-string list is checked element by element.
+Z_COLORSCALE = [[0.0, '#555'], [0.5, '#FF4B4B'], [1.0, '#00FF7F']]
+
+def zscore_color_codes(z, threshold):
+    """Colour code per z-score bar (see Z_COLORSCALE), computed with array operations."""
+    z = np.asarray(z, dtype=np.float64)
+    return np.where(z > threshold, 1.0, np.where(z < -threshold, 2.0, 0.0))
+
+def scatter_type(n_points, threshold=config.CHART_WEBGL_THRESHOLD):
+    """Scatter for small traces, Scattergl (WebGL) above `threshold` points."""
+    return go.Scattergl if n_points > threshold else go.Scatter
+
+class PairChart:
+    """
+    Four-pane pair chart updated in place across reruns. The figure is
+    rebuilt only when its structure changes (pair, window label, or the
+    SVG/WebGL line type); build times are kept for the diagnostics tab.
+    """
+    # Trace slots in the figure, in the order _build adds them
+    PRICE_Y, PRICE_X, SPREAD, SPREAD_MA, ZSCORE, VOL_X, VOL_Y = range(7)
+
+    def __init__(self):
+        self.fig = None
+        self.signature = None
+        self.build_ms = deque(maxlen=100)
+        self.rebuilds = 0
+        self.points = 0
+        self.payload_bytes = 0
+
+    def _build(self, sym_x, sym_y, window, line):
+        fig = make_subplots(
+            rows=4, cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.10,
+            row_heights=[0.35, 0.2, 0.2, 0.15],
+            subplot_titles=(
+                f"Price Action ({sym_y} vs {sym_x})",
+                "Spread Analysis",
+                "Z-Score Signal",
+                "Liquidity Profile"
+            )
+        )
+        fig.add_trace(line(name=sym_y, line=dict(color='#00F0FF', width=2)), row=1, col=1)
+        fig.add_trace(line(name=sym_x, line=dict(color='#FFA500', width=2), yaxis='y2'), row=1, col=1)
+        fig.add_trace(line(name="Spread", line=dict(color='#E0E0E0', width=1.5), fill='tozeroy', fillcolor='rgba(224, 224, 224, 0.05)'), row=2, col=1)
+        fig.add_trace(line(name=f"MA({window})", line=dict(color='#888', width=1, dash='dot')), row=2, col=1)
+        fig.add_trace(go.Bar(name="Z-Score", marker=dict(colorscale=Z_COLORSCALE, cmin=0, cmax=2)), row=3, col=1)
+        fig.add_trace(go.Bar(name="Vol X", marker_color='#FFA500', opacity=0.5), row=4, col=1)
+        fig.add_trace(go.Bar(name="Vol Y", marker_color='#00F0FF', opacity=0.5), row=4, col=1)
+        # Entry threshold lines (layout shapes 0 / 1), moved on every update
+        fig.add_hline(y=0, line_dash="dash", line_color="rgba(255, 75, 75, 0.5)", row=3, col=1)
+        fig.add_hline(y=0, line_dash="dash", line_color="rgba(0, 255, 127, 0.5)", row=3, col=1)
+
+        fig.update_layout(
+            height=900,
+            template="plotly_dark",
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(l=20, r=20, t=100, b=20),
+            hovermode="x unified",
+            legend=dict(orientation="h", yanchor="bottom", y=1.12, xanchor="right", x=1, bgcolor='rgba(0,0,0,0)'),
+            yaxis2=dict(overlaying='y', side='right', showgrid=False, title=sym_x),
+            yaxis=dict(title=sym_y),
+            font=dict(family="Inter, sans-serif")
+        )
+        # Remove gridlines for cleaner look on lower subplots
+        fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='#333', row=1, col=1)
+        for row in (2, 3, 4):
+            fig.update_yaxes(showgrid=False, row=row, col=1)
+        self.rebuilds += 1
+        return fig
+
+    def update(self, df, sym_x, sym_y, window, z_thresh, calibrated, max_points=config.CHART_MAX_POINTS):
+        """
+        Refresh the chart from an analytics frame (x, y and, once calibrated,
+        spread / z_score; vol_x / vol_y if present). Every trace is capped at
+        max_points (None = all rows): LTTB for lines, min/max buckets for bars,
+        keeping z-score entry threshold crossings. Returns the figure.
+        """
+        t0 = time.perf_counter()
+        index = df.index
+        x = axis_values(index)
+
+        def line_points(values):
+            values = np.asarray(values, dtype=np.float64)
+            rows = lttb_indices(x, values, max_points)
+            return index[rows], values[rows]
+
+        def bar_points(values, keep_levels=()):
+            values = np.asarray(values, dtype=np.float64)
+            rows = minmax_indices(values, max_points, keep_levels)
+            return index[rows], values[rows]
+
+        empty = (index[:0], np.empty(0))
+        has_vol = 'vol_x' in df.columns
+        points = {
+            self.PRICE_Y: line_points(df['y']),
+            self.PRICE_X: line_points(df['x']),
+            self.SPREAD: line_points(df['spread']) if calibrated else empty,
+            self.SPREAD_MA: line_points(df['spread'].rolling(window=window).mean()) if calibrated else empty,
+            self.ZSCORE: bar_points(df['z_score'], (z_thresh, -z_thresh)) if calibrated else empty,
+            self.VOL_X: bar_points(df['vol_x']) if has_vol else empty,
+            self.VOL_Y: bar_points(df['vol_y']) if has_vol else empty,
+        }
+
+        line = scatter_type(max(len(points[k][0]) for k in (self.PRICE_Y, self.PRICE_X, self.SPREAD, self.SPREAD_MA)))
+        signature = (sym_x, sym_y, window, line)
+        if self.fig is None or signature != self.signature:
+            self.fig = self._build(sym_x, sym_y, window, line)
+            self.signature = signature
+
+        fig = self.fig
+        shown = {self.SPREAD: calibrated, self.SPREAD_MA: calibrated, self.ZSCORE: calibrated,
+                 self.VOL_X: has_vol, self.VOL_Y: has_vol}
+        with fig.batch_update():
+            for slot, (px, py) in points.items():
+                fig.data[slot].update(x=px, y=py, visible=shown.get(slot, True))
+            fig.data[self.ZSCORE].marker.color = zscore_color_codes(points[self.ZSCORE][1], z_thresh)
+            for shape, level in zip(fig.layout.shapes, (z_thresh, -z_thresh)):
+                shape.update(y0=level, y1=level, visible=calibrated)
+
+        self.points = sum(len(px) for px, _ in points.values())
+        self.build_ms.append((time.perf_counter() - t0) * 1000)
+        return fig
+
+    def measure_payload(self) -> int:
+        """Size of the figure's JSON (what Streamlit ships to the browser), in bytes."""
+        self.payload_bytes = len(self.fig.to_json()) if self.fig is not None else 0
+        return self.payload_bytes
+
+    def stats(self) -> dict:
+        ms = list(self.build_ms)
+        return {
+            'last_ms': ms[-1] if ms else 0.0,
+            'avg_ms': sum(ms) / len(ms) if ms else 0.0,
+            'rebuilds': self.rebuilds,
+            'points': self.points,
+            'payload_kb': self.payload_bytes / 1024,
+            'webgl': self.signature is not None and self.signature[-1] is go.Scattergl,
+        }
@@ -1,19 +1,74 @@
 ﻿import os
 
 # --- Data Source Config ---
-BINANCE_WS_URL = "wss://fstream.binance.com/stream?streams="
-# Default StatArb Pair: ETH vs BTC
-SYMBOLS = ["BTCUSDT", "ETHUSDT"] 
+# Override to point at a local simulator, e.g. "ws://localhost:8765/stream?streams="
+BINANCE_WS_URL = os.environ.get("BINANCE_WS_URL", "wss://fstream.binance.com/stream?streams=")
+# Default StatArb Pair: ETH vs BTC. Set ALPHASTREAM_SYMBOLS (comma-separated) to stream a wider universe
+SYMBOLS = [s.strip().upper() for s in os.environ.get("ALPHASTREAM_SYMBOLS", "BTCUSDT,ETHUSDT").split(",") if s.strip()]
+# Ingest engine: "asyncio" (many sharded sockets on one event loop) or "thread" (single socket)
+INGEST_ENGINE = "asyncio"
+WS_MAX_STREAMS_PER_CONNECTION = 200   # Binance Futures combined-stream limit per socket
+INGEST_BATCH_SIZE = 256               # Hand ticks to storage when this many are parsed...
+INGEST_BATCH_INTERVAL_S = 0.02        # ...or at least this often
+JSON_BACKEND = "auto"                 # "auto" (fastest installed), "orjson", "ujson" or "json"
+PARSE_ERROR_LOG_INTERVAL_S = 5.0      # Parse failures are counted, logged at most this often
 
 # --- Storage Config ---
 DB_NAME = "tick_store.db"
 # Keep last N ticks in memory for high-speed calculation
 MEMORY_BUFFER_SIZE = 2000 
+# Write-behind persistence: ticks are queued and committed in batches
+DB_WRITE_QUEUE_SIZE = 100000   # Max pending ticks before new ones are dropped
+DB_WRITE_BATCH_SIZE = 500      # Flush when this many ticks are pending...
+DB_FLUSH_INTERVAL_S = 0.25     # ...or when the oldest pending tick is this old
+DB_BUSY_RETRIES = 3            # Writer retries for a batch that hits SQLITE_BUSY (e.g. during compaction)
+QUERY_CHUNK_SIZE = 50000       # Rows per chunk streamed by TradeStore.query
+# Optional memory-mapped binary tick journal (one append-only file per symbol)
+JOURNAL_ENABLED = False
+JOURNAL_DIR = "tick_journal"
+JOURNAL_SYNC_INTERVAL_S = 1.0        # msync period for dirty journal pages
+JOURNAL_GROW_RECORDS = 1 << 20       # Records preallocated per file extension (32 MiB)
+# Parquet archive tier: closed days are rolled out of SQLite per symbol/day
+ARCHIVE_ENABLED = True
+ARCHIVE_DIR_SUFFIX = "_archive"       # Archive root next to the SQLite file: tick_store.db -> tick_store_archive/
+ARCHIVE_HOT_DAYS = 1                 # Most recent UTC days kept in SQLite (1 = today only)
+ARCHIVE_COMPRESSION = "zstd"
+ARCHIVE_ROW_GROUP_SIZE = 100000
+ARCHIVE_COMPACT_INTERVAL_S = 3600    # How often the dashboard's background compactor runs
+ARCHIVE_DELETE_CHUNK = 5000          # Archived rows deleted from SQLite per transaction
+# Pre-aggregated OHLCV bars maintained at write time: table suffix -> seconds
+BAR_INTERVALS = {"1s": 1, "1m": 60, "5m": 300, "1h": 3600}
+RESAMPLED_TABLE_BARS = 240   # Bars shown in the "Resampled Stats (1m)" tab
+# Per-stage latency histograms (exchange event -> buffer -> disk / analytics)
+LATENCY_TRACKING = True
 
 # --- Analytics Config ---
 DEFAULT_LOOKBACK_WINDOW = 100
 DEFAULT_Z_THRESHOLD = 2.0
+KALMAN_DELTA = 1e-4   # Kalman process noise (flexibility of beta)
+KALMAN_R = 1e-3       # Kalman measurement noise
 RISK_FREE_RATE = 0.0
+CSV_CHUNK_ROWS = 200000   # Rows parsed per chunk when importing a historical CSV upload
+# Pair scanner (scanner.py): every pair of the universe, rescanned once per bucket
+SCANNER_INTERVAL = "1m"        # Bar interval (see BAR_INTERVALS)
+SCANNER_LOOKBACK_BARS = 1440   # Bars per scan (1 day of 1m bars)
+SCANNER_MIN_BARS = 100         # Pairs with fewer common bars are skipped
+SCANNER_BUCKET_S = 300         # Results are cached / persisted per 5-minute bucket
+SCANNER_WORKERS = None         # Process pool size (None = all cores)
+SCANNER_ADF_MAXLAG = 1         # Fixed ADF lag order (no AIC search) to keep 1000s of tests cheap
+SWEEP_WORKERS = None           # Process pool size for the backtest parameter sweep (None = all cores)
+SWEEP_START_METHOD = "forkserver" # Sweep worker start method ("forkserver" or "spawn"; never fork the dashboard)
+ANALYTICS_CACHE_ENTRIES = 64   # Dashboard analytics cache: max results kept (LRU)
+ANALYTICS_CACHE_MB = 256       # ... and max approximate size of those results
+ADF_MODE = "full"              # Inspection-tab ADF: "full" (AIC lag search) or "fast" (fixed lag, incremental)
+ADF_FAST_LAG = 1               # Lag order of the fast mode
+ADF_MIN_INTERVAL_S = 10.0      # Re-test at most this often...
+ADF_MIN_NEW_SAMPLES = 500      # ...unless this many new spread samples have arrived
 
 # --- Visualization ---
-REFRESH_RATE_MS = 1000  # Dashboard refresh rate
+REFRESH_RATE_MS = 1000  # Live KPI strip refresh rate
+CHART_REFRESH_MS = 2000 # Main chart refresh rate
+TABS_REFRESH_S = 15     # Backtest / stats / inspection / diagnostics tabs refresh cadence (also on demand)
+CHART_MAX_POINTS = 2000  # Default per-trace point cap for the main chart (~ its pixel width)
+CHART_POINT_OPTIONS = [500, 1000, 2000, 4000, 8000]  # Sidebar choices (plus "Full")
+CHART_WEBGL_THRESHOLD = 5000  # Line traces switch from SVG Scatter to WebGL Scattergl above this many points
@@ -0,0 +1,187 @@
+﻿"""
+Fast-path aggTrade frame decoding.
+- Picks the fastest installed JSON backend (orjson > ujson > stdlib json).
+- AggTradeDecoder parses frames straight into preallocated column arrays so
+  a micro-batch can be handed to TradeStore.save_batch without per-tick dicts.
+- Parse failures are counted and logged at most once per interval.
+
+Run `python decoder.py` for a frames/sec microbenchmark of each backend.
+"""
+import json
+import time
+from array import array
+import numpy as np
+import config
+
+def _available_backends():
+    backends = {}
+    try:
+        import orjson
+        backends['orjson'] = orjson.loads
+    except ImportError:
+        pass
+    try:
+        import ujson
+        backends['ujson'] = ujson.loads
+    except ImportError:
+        pass
+    backends['json'] = json.loads
+    return backends
+
+BACKENDS = _available_backends()
+DEFAULT_BACKEND = next(iter(BACKENDS))
+
+def get_loads(backend='auto'):
+    """JSON decode function for `backend` ('auto' = fastest installed)."""
+    if backend == 'auto':
+        backend = DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"JSON backend '{backend}' is not installed (available: {', '.join(BACKENDS)})")
+    return BACKENDS[backend]
+
+class ParseErrorCounter:
+    """Counts parse failures; prints a summary at most once per `interval` seconds."""
+    def __init__(self, interval=config.PARSE_ERROR_LOG_INTERVAL_S):
+        self.interval = interval
+        self.total = 0
+        self.since_log = 0
+        self.last_log = float('-inf')
+        self.last_error = None
+
+    def record(self, error):
+        self.total += 1
+        self.since_log += 1
+        self.last_error = error
+        now = time.monotonic()
+        if now - self.last_log >= self.interval:
+            print(f"[WS Error] Parse failed x{self.since_log} (total {self.total}): {error!r}")
+            self.last_log = now
+            self.since_log = 0
+
+class AggTradeDecoder:
+    """
+    Decodes combined-stream aggTrade frames into preallocated columns.
+    decode() fills the next slot; drain() returns the filled slots as a
+    column batch and resets the cursor. Numeric columns are preallocated
+    float64 `array.array`s (cheap scalar stores) exposed to NumPy zero-copy.
+    The arrays are reused, so the batch must be consumed (e.g. by
+    TradeStore.save_batch) before the next decode.
+    """
+    def __init__(self, capacity=config.INGEST_BATCH_SIZE, backend='auto', errors=None):
+        self.capacity = int(capacity)
+        self.backend = DEFAULT_BACKEND if backend == 'auto' else backend
+        self.loads = get_loads(self.backend)
+        self.errors = errors if errors is not None else ParseErrorCounter()
+
+        self.symbol = [None] * self.capacity
+        self.timestamp = array('d', bytes(8 * self.capacity))
+        self.trade_time = array('d', bytes(8 * self.capacity))
+        self.price = array('d', bytes(8 * self.capacity))
+        self.size = array('d', bytes(8 * self.capacity))
+        self.agg_id = array('q', bytes(8 * self.capacity))
+        self.recv_time = array('d', bytes(8 * self.capacity))
+        self.parse_time = array('d', bytes(8 * self.capacity))
+        self.n = 0
+
+    @property
+    def full(self):
+        return self.n >= self.capacity
+
+    def decode(self, message, recv_time):
+        """Parse one frame into the next slot. Returns True if a trade was stored."""
+        if self.n >= self.capacity:
+            raise OverflowError("AggTradeDecoder is full; drain() before decoding more frames")
+        try:
+            payload = self.loads(message).get('data')
+            if payload is None:
+                return False  # Control frame (e.g. subscription ack)
+            i = self.n
+            event_ms = payload['E']
+            self.symbol[i] = payload['s']
+            self.timestamp[i] = event_ms / 1000.0
+            self.trade_time[i] = payload.get('T', event_ms) / 1000.0
+            self.price[i] = float(payload['p'])
+            self.size[i] = float(payload['q'])
+            self.agg_id[i] = payload.get('a', -1)
+            self.recv_time[i] = recv_time
+            self.parse_time[i] = time.time()
+        except Exception as e:
+            self.errors.record(e)
+            return False
+        self.n = i + 1
+        return True
+
+    def drain(self) -> dict:
+        """Column batch of everything decoded since the last drain (views into reused arrays)."""
+        n = self.n
+        self.n = 0
+        view = lambda col: np.frombuffer(col, dtype=np.float64, count=n)
+        return {
+            'symbol': self.symbol[:n],
+            'timestamp': view(self.timestamp),
+            'trade_time': view(self.trade_time),
+            'price': view(self.price),
+            'size': view(self.size),
+            'agg_id': np.frombuffer(self.agg_id, dtype=np.int64, count=n),
+            'recv_time': view(self.recv_time),
+            'parse_time': view(self.parse_time),
+        }
+
+def benchmark(n_frames=200000):
+    """Frames/sec for the dict path and the column path with every installed backend."""
+    from simulator import PriceGenerator, make_frame
+
+    gen = PriceGenerator(config.SYMBOLS, seed=0)
+    now_ms = int(time.time() * 1000)
+    frames = []
+    for i in range(n_frames):
+        sym = config.SYMBOLS[i % len(config.SYMBOLS)]
+        price, qty, agg_id = gen.next_trade(sym)
+        frames.append(make_frame(sym, price, qty, agg_id, now_ms))
+
+    for name, loads in BACKENDS.items():
+        # Dict path: full envelope parse + per-tick dict (what parse_agg_trade does)
+        t0 = time.perf_counter()
+        for frame in frames:
+            payload = loads(frame)['data']
+            {'timestamp': payload['E'] / 1000.0, 'symbol': payload['s'],
+             'price': float(payload['p']), 'size': float(payload['q']),
+             'trade_time': payload.get('T', payload['E']) / 1000.0,
+             'recv_time': 0.0, 'parse_time': time.time()}
+        dict_rate = n_frames / (time.perf_counter() - t0)
+
+        # Column path: decode into preallocated arrays, drain per micro-batch
+        dec = AggTradeDecoder(backend=name)
+        t0 = time.perf_counter()
+        for frame in frames:
+            dec.decode(frame, 0.0)
+            if dec.full:
+                dec.drain()
+        col_rate = n_frames / (time.perf_counter() - t0)
+        print(f"{name:<8} dict path {dict_rate:>12,.0f} frames/s | column path {col_rate:>12,.0f} frames/s")
+
+    # Decode + hand-off into a TradeStore (memory buffer, writer queue, latency stats)
+    import os
+    import tempfile
+    from storage import TradeStore
+    from ingest import parse_agg_trade
+
+    store = TradeStore(db_name=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    t0 = time.perf_counter()
+    for frame in frames:
+        store.save_tick(parse_agg_trade(frame, 0.0))
+    tick_rate = n_frames / (time.perf_counter() - t0)
+
+    dec = AggTradeDecoder()
+    t0 = time.perf_counter()
+    for frame in frames:
+        if dec.decode(frame, 0.0) and dec.full:
+            store.save_batch(dec.drain())
+    store.save_batch(dec.drain())
+    batch_rate = n_frames / (time.perf_counter() - t0)
+    store.close()
+    print(f"{DEFAULT_BACKEND:<8} + store: per-tick save_tick {tick_rate:>9,.0f} frames/s | "
+          f"micro-batched save_batch {batch_rate:>9,.0f} frames/s")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,98 @@
+﻿"""
+Server-side downsampling for Plotly traces.
+The dashboard chart only has a few thousand horizontal pixels, so shipping
+every aligned row just inflates the JSON payload and browser render time.
+
+- Lines use Largest-Triangle-Three-Buckets (LTTB): one point per bucket,
+  chosen to preserve the visual shape (peaks and troughs survive).
+- Bars use min/max bucketing: the lowest and highest row of every bucket.
+  With levels given (e.g. the z-score entry thresholds), the first row
+  crossing one of them in each bucket is kept too, so signals stay visible.
+
+All functions return sorted row positions into the input, so callers can
+slice x, y and any per-row styling consistently.
+"""
+import numpy as np
+import pandas as pd
+
+def axis_values(index) -> np.ndarray:
+    """Numeric x for an index: int64 ns for datetimes, floats otherwise."""
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(np.float64)
+    return np.asarray(index, dtype=np.float64)
+
+def lttb_indices(x, y, n_out):
+    """
+    Row positions of the LTTB selection of (x, y): the first and last
+    finite points plus one per bucket, n_out points in total.
+    NaN rows are ignored; every row is returned when n_out >= the finite rows.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    rows = np.flatnonzero(np.isfinite(y))
+    n = len(rows)
+    if not n_out or n_out >= n or n_out < 3:
+        return rows
+    x, y = x[rows] - x[rows[0]], y[rows]
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Third vertex: next bucket's centroid (the last point after the final bucket)
+        cx, cy = (mean_x[b + 1], mean_y[b + 1]) if b + 3 < n_out else (x[-1], y[-1])
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        out[b + 1] = a
+    return rows[out]
+
+def crossing_indices(y, levels):
+    """
+    Rows where y moves to the other side of any of `levels` (the first row past the level).
+    Only steps between two finite values count, so NaN warm-up rows are never crossings.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(y)
+    both = finite[:-1] & finite[1:]
+    hits = [np.flatnonzero((np.diff(np.sign(y - level)) != 0) & both) + 1 for level in levels]
+    return np.unique(np.concatenate(hits)) if hits else np.empty(0, dtype=np.int64)
+
+def minmax_indices(y, n_out, keep_levels=()):
+    """
+    Row positions keeping the min and max of each bucket, the first and
+    last row, and with `keep_levels` the first crossing of any level in
+    each bucket. At most n_out rows.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if not n_out or n <= n_out:
+        return np.arange(n)
+    # Two of the n_out slots are the fixed ends
+    buckets = max(1, (n_out - 2) // (3 if len(keep_levels) else 2))
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    with np.errstate(invalid='ignore'):
+        lows = np.fmin.reduceat(y, edges[:-1])
+        highs = np.fmax.reduceat(y, edges[:-1])
+    # First row matching each bucket's extreme (all-NaN buckets have none)
+    is_low = np.flatnonzero(y == lows[bucket])
+    is_high = np.flatnonzero(y == highs[bucket])
+    first_low = is_low[np.unique(bucket[is_low], return_index=True)[1]]
+    first_high = is_high[np.unique(bucket[is_high], return_index=True)[1]]
+    parts = [first_low, first_high, [0, n - 1]]
+    if len(keep_levels):
+        crossings = crossing_indices(y, keep_levels)
+        parts.append(crossings[np.unique(bucket[crossings], return_index=True)[1]])
+    rows = np.unique(np.concatenate(parts).astype(np.int64))
+    if len(rows) > n_out:
+        # Only reachable for tiny caps (one bucket already exceeds them): keep the ends
+        rows = np.r_[rows[:max(n_out - 1, 0)], rows[-1]] if n_out > 1 else rows[:n_out]
+    return rows
@@ -1,9 +1,47 @@
 ﻿import websocket
-import json
+import asyncio
 import threading
 import time
 from datetime import datetime
+from websockets.asyncio.client import connect as ws_connect
 import config
+from decoder import AggTradeDecoder, ParseErrorCounter, get_loads
+
+_loads = get_loads(config.JSON_BACKEND)
+_parse_errors = ParseErrorCounter()
+
+def parse_agg_trade(message, recv_time):
+    """
+    Binance AggTrade Format:
+    {
+      "e": "aggTrade",  // Event type
+      "E": 123456789,   // Event time
+      "s": "BTCUSDT",   // Symbol
+      "p": "0.001",     // Price
+      "q": "100",       // Quantity
+      "T": 123456785,   // Trade time
+      ...
+    }
+    Returns a tick dict, or None if the frame is not a trade.
+    """
+    try:
+        data = _loads(message)
+        if 'data' in data:
+            payload = data['data']
+            return {
+                'timestamp': payload['E'] / 1000.0, # Convert ms to seconds
+                'symbol': payload['s'],
+                'price': float(payload['p']),
+                'size': float(payload['q']),
+                'agg_id': payload.get('a', -1),
+                # Latency stamps (epoch seconds)
+                'trade_time': payload.get('T', payload['E']) / 1000.0,
+                'recv_time': recv_time,
+                'parse_time': time.time()
+            }
+    except Exception as e:
+        _parse_errors.record(e)
+    return None
 
 class BinanceStreamer(threading.Thread):
     """
@@ -25,30 +63,9 @@ class BinanceStreamer(threading.Thread):
         return f"{config.BINANCE_WS_URL}{streams}"
 
     def on_message(self, ws, message):
-        """
-        Binance AggTrade Format:
-        {
-          "e": "aggTrade",  // Event type
-          "E": 123456789,   // Event time
-          "s": "BTCUSDT",   // Symbol
-          "p": "0.001",     // Price
-          "q": "100",       // Quantity
-          ...
-        }
-        """
-        try:
-            data = json.loads(message)
-            if 'data' in data:
-                payload = data['data']
-                tick = {
-                    'timestamp': payload['E'] / 1000.0, # Convert ms to seconds
-                    'symbol': payload['s'],
-                    'price': float(payload['p']),
-                    'size': float(payload['q'])
-                }
-                self.store.save_tick(tick)
-        except Exception as e:
-            print(f"[WS Error] Parse failed: {e}")
+        tick = parse_agg_trade(message, time.time())
+        if tick is not None:
+            self.store.save_tick(tick)
 
     def on_error(self, ws, error):
         print(f"[WS Error] {error}")
@@ -80,3 +97,113 @@ class BinanceStreamer(threading.Thread):
         self.keep_running = False
         if self.ws:
             self.ws.close()
+
+class AsyncBinanceStreamer(threading.Thread):
+    """
+    asyncio Ingest Engine.
+    One background thread runs an event loop holding many combined-stream
+    connections. Symbols are sharded across sockets so each stays under
+    Binance's per-connection stream limit. Frames are decoded straight into
+    preallocated columns (decoder.AggTradeDecoder) and handed to the store
+    in micro-batches (size- or time-triggered) via save_batch.
+    Same start()/stop() interface as BinanceStreamer.
+    """
+
+    def __init__(self, store, symbols=config.SYMBOLS,
+                 streams_per_connection=config.WS_MAX_STREAMS_PER_CONNECTION):
+        super().__init__(name="AsyncBinanceStreamer")
+        self.store = store
+        self.symbols = [s.lower() for s in symbols]
+        self.shards = [
+            self.symbols[i:i + streams_per_connection]
+            for i in range(0, len(self.symbols), streams_per_connection)
+        ]
+        self.keep_running = True
+        self.daemon = True  # Killed when main process exits
+
+        self.loop = None
+        self._tasks = []
+        # Decoded ticks awaiting hand-off (event-loop thread only)
+        self.decoder = AggTradeDecoder(config.INGEST_BATCH_SIZE, config.JSON_BACKEND)
+        self.connected = set()  # Shard ids with a live socket
+        self.reconnects = 0
+        # Failed hand-offs to the store (the batch is dropped; sockets and flush task keep running)
+        self.handoff_errors = 0
+        self.handoff_dropped = 0
+        self._handoff_last_log = float('-inf')
+
+    def _get_stream_url(self, shard):
+        streams = "/".join([f"{s}@aggTrade" for s in shard])
+        return f"{config.BINANCE_WS_URL}{streams}"
+
+    def _flush(self):
+        if not self.decoder.n:
+            return
+        batch = self.decoder.drain()
+        try:
+            self.store.save_batch(batch)
+        except Exception as e:
+            # A storage failure must not look like a socket failure or kill the flush task
+            self.handoff_errors += 1
+            self.handoff_dropped += len(batch['price'])
+            now = time.monotonic()
+            if now - self._handoff_last_log >= config.PARSE_ERROR_LOG_INTERVAL_S:
+                print(f"[Ingest Error] Hand-off failed x{self.handoff_errors} ({self.handoff_dropped} ticks dropped): {e!r}")
+                self._handoff_last_log = now
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(config.INGEST_BATCH_INTERVAL_S)
+            self._flush()
+
+    async def _run_connection(self, shard_id, shard):
+        url = self._get_stream_url(shard)
+        backoff = 1
+        while self.keep_running:
+            try:
+                print(f"[WS] Shard {shard_id}: connecting ({len(shard)} streams)...")
+                async with ws_connect(url, compression=None, max_size=None, max_queue=None) as ws:
+                    self.connected.add(shard_id)
+                    backoff = 1
+                    decoder = self.decoder
+                    async for message in ws:
+                        if decoder.decode(message, time.time()) and decoder.full:
+                            self._flush()
+                print(f"[WS] Shard {shard_id}: closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WS] Shard {shard_id}: connection failed: {e}. Retrying in {backoff}s...")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                self.connected.discard(shard_id)
+            self.reconnects += 1
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._tasks = [
+            asyncio.create_task(self._run_connection(i, shard))
+            for i, shard in enumerate(self.shards)
+        ]
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._flush()
+
+    def run(self):
+        asyncio.run(self._main())
+
+    def stop(self):
+        self.keep_running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(lambda: [t.cancel() for t in self._tasks])
+
+def create_streamer(store, symbols=config.SYMBOLS):
+    """Build the ingest engine selected by config.INGEST_ENGINE."""
+    if config.INGEST_ENGINE == "asyncio":
+        return AsyncBinanceStreamer(store, symbols)
+    return BinanceStreamer(store, symbols)
@@ -0,0 +1,264 @@
+﻿"""
+Append-only, memory-mapped binary tick journal.
+One file per symbol holds a fixed 64-byte header followed by fixed-size
+records (timestamp, price, size, agg_id). The writer appends through a
+writable mmap and msyncs periodically; readers in other processes map the
+same file read-only and get the committed records as a zero-copy NumPy
+structured array.
+
+Layout:
+    header  magic(8) | record_size u4 | reserved u4 | count u8 | symbol(16) | pad
+    records RECORD_DTYPE * capacity   (preallocated, zero-filled)
+
+`count` is only advanced after the records it covers are written, so a
+reader never sees a half-written record. On open the writer also accepts
+complete records past `count` (written but not yet counted at crash time)
+and zeroes a torn tail record.
+
+Usage:
+    python journal.py tail BTCUSDT       # print the last records of a journal
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+import config
+
+MAGIC = b"ASJRNL01"
+HEADER_SIZE = 64
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('price', '<f8'),
+    ('size', '<f8'),
+    ('agg_id', '<i8'),
+])
+_COUNT_OFFSET = 16
+
+def journal_path(root, symbol):
+    return os.path.join(root, f"{symbol}.journal")
+
+def _complete(records):
+    """Records whose every field was written (zero-filled slots and torn writes fail)."""
+    return (records['timestamp'] > 0) & (records['price'] > 0) & (records['size'] > 0)
+
+class TickJournal:
+    """Single-writer journal for one symbol."""
+
+    def __init__(self, path, symbol, grow_records=config.JOURNAL_GROW_RECORDS):
+        self.path = path
+        self.symbol = symbol
+        self.grow_records = int(grow_records)
+        self.lock = threading.Lock()
+        self.dirty = False
+
+        new = not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if new:
+            header = struct.pack("<8sII Q16s", MAGIC, RECORD_DTYPE.itemsize, 0, 0, symbol.encode()[:16])
+            os.ftruncate(self.fd, HEADER_SIZE + self.grow_records * RECORD_DTYPE.itemsize)
+            os.pwrite(self.fd, header.ljust(HEADER_SIZE, b"\0"), 0)
+        else:
+            self._check_header()
+            size = os.fstat(self.fd).st_size
+            torn = (size - HEADER_SIZE) % RECORD_DTYPE.itemsize
+            if torn:
+                # Crashed mid-extend: drop the partial record at the end of the file
+                os.ftruncate(self.fd, size - torn)
+        self._map()
+        self._recover()
+
+    def _check_header(self):
+        magic, record_size = struct.unpack("<8sI", os.pread(self.fd, 12, 0))
+        if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{self.path} is not a tick journal (or has an incompatible record layout)")
+
+    def _map(self):
+        size = os.fstat(self.fd).st_size
+        self.mm = mmap.mmap(self.fd, size)
+        self.capacity = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        self.records = np.frombuffer(self.mm, dtype=RECORD_DTYPE, count=self.capacity, offset=HEADER_SIZE)
+        self._count = np.frombuffer(self.mm, dtype='<u8', count=1, offset=_COUNT_OFFSET)
+
+    def _unmap(self):
+        # NumPy views export the mmap buffer; release them before closing it
+        del self.records, self._count
+        self.mm.close()
+
+    def _recover(self):
+        n = min(int(self._count[0]), self.capacity)
+        tail = self.records[n:]
+        ok = _complete(tail)
+        valid = int(np.argmin(ok)) if not ok.all() else len(ok)
+        if valid:
+            print(f"[Journal] {self.symbol}: recovered {valid} uncommitted records")
+        n += valid
+        if n < self.capacity and self.records[n:].view(np.uint8).any():
+            print(f"[Journal] {self.symbol}: truncated torn tail at record {n}")
+            self.records[n:] = np.zeros(1, dtype=RECORD_DTYPE)
+        self._count[0] = n
+        self.n = n
+
+    def _grow(self, needed):
+        new_capacity = self.capacity
+        while new_capacity < needed:
+            new_capacity += self.grow_records
+        self.mm.flush()
+        self._unmap()
+        os.ftruncate(self.fd, HEADER_SIZE + new_capacity * RECORD_DTYPE.itemsize)
+        self._map()
+
+    def __len__(self):
+        return self.n
+
+    def append(self, timestamp, price, size, agg_id=None):
+        """Append a batch of records (array-likes of equal length)."""
+        k = len(timestamp)
+        if k == 0:
+            return
+        with self.lock:
+            if self.mm.closed:
+                return  # Late append after close(): the map is gone
+            n = self.n
+            if n + k > self.capacity:
+                self._grow(n + k)
+            out = self.records[n:n + k]
+            out['timestamp'] = timestamp
+            out['price'] = price
+            out['size'] = size
+            out['agg_id'] = -1 if agg_id is None else agg_id
+            # Publish only after the records are in place
+            self.n = n + k
+            self._count[0] = self.n
+            self.dirty = True
+
+    def sync(self):
+        """msync dirty pages (records and header) to disk."""
+        with self.lock:
+            if self.dirty:
+                self.mm.flush()
+                self.dirty = False
+
+    def close(self):
+        with self.lock:
+            if self.mm.closed:
+                return
+            self.dirty = False
+            self.mm.flush()
+            self._unmap()
+            os.close(self.fd)
+
+class JournalReader:
+    """
+    Read-only view of a journal, safe to use from another process while the
+    writer appends. records() is a zero-copy structured array of the ticks
+    committed at the last refresh().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        magic, record_size = struct.unpack("<8sI", os.pread(self.fd, 12, 0))
+        if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a tick journal (or has an incompatible record layout)")
+        self.mm = None
+        self.refresh()
+
+    def refresh(self):
+        """Pick up records appended since the last call (remaps if the file grew)."""
+        size = os.fstat(self.fd).st_size
+        if self.mm is None or size != len(self.mm):
+            # Don't close the old map: views handed out by records() may still use it
+            self.mm = mmap.mmap(self.fd, size, access=mmap.ACCESS_READ)
+        capacity = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        count = int(np.frombuffer(self.mm, dtype='<u8', count=1, offset=_COUNT_OFFSET)[0])
+        self.count = min(count, capacity)
+        return self.count
+
+    def __len__(self):
+        return self.count
+
+    def records(self, start=0, stop=None):
+        """Structured array view of committed records [start, stop). Call refresh() first for new data."""
+        stop = self.count if stop is None else min(stop, self.count)
+        start = max(0, min(start, stop))
+        return np.frombuffer(
+            self.mm, dtype=RECORD_DTYPE, count=stop - start,
+            offset=HEADER_SIZE + start * RECORD_DTYPE.itemsize
+        )
+
+    def close(self):
+        # Views returned by records() keep the map alive; only close when they are gone
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+        os.close(self.fd)
+
+class TickJournalSet:
+    """
+    Per-symbol journals under one directory, with a background msync thread
+    flushing dirty maps every `sync_interval` seconds.
+    """
+
+    def __init__(self, root=config.JOURNAL_DIR, sync_interval=config.JOURNAL_SYNC_INTERVAL_S):
+        self.root = root
+        self.sync_interval = sync_interval
+        self.journals = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        os.makedirs(root, exist_ok=True)
+        if sync_interval and sync_interval > 0:
+            t = threading.Thread(target=self._sync_loop, name="JournalSync", daemon=True)
+            t.start()
+
+    def get(self, symbol):
+        journal = self.journals.get(symbol)
+        if journal is None:
+            with self.lock:
+                journal = self.journals.get(symbol)
+                if journal is None:
+                    journal = TickJournal(journal_path(self.root, symbol), symbol)
+                    self.journals[symbol] = journal
+        return journal
+
+    def append(self, symbol, timestamp, price, size, agg_id=None):
+        self.get(symbol).append(timestamp, price, size, agg_id)
+
+    def _sync_loop(self):
+        while not self.closed:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self):
+        for journal in list(self.journals.values()):
+            try:
+                journal.sync()
+            except Exception as e:
+                print(f"[Journal Error] msync failed for {journal.symbol}: {e}")
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            for journal in self.journals.values():
+                journal.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect memory-mapped tick journals")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_tail = sub.add_parser('tail', help="Print the last records of a symbol's journal")
+    p_tail.add_argument('symbol')
+    p_tail.add_argument('-n', type=int, default=10)
+    p_tail.add_argument('--dir', default=config.JOURNAL_DIR)
+    args = parser.parse_args()
+
+    reader = JournalReader(journal_path(args.dir, args.symbol.upper()))
+    recs = reader.records(max(0, len(reader) - args.n))
+    print(f"[Journal] {args.symbol.upper()}: {len(reader)} records")
+    for r in recs:
+        print(f"{r['timestamp']:.3f}  {r['price']:<14.4f} {r['size']:<12.4f} {r['agg_id']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+﻿"""
+Latency instrumentation for the tick pipeline.
+Each stage (exchange -> socket receive -> parse -> buffer -> disk / analytics)
+records its delay into an HDR-style log-linear histogram so p50/p99/max can be
+read cheaply at any time without storing individual samples.
+"""
+from threading import Lock
+
+# Pipeline stages in display order: name -> description
+STAGES = {
+    'trade_to_event': "Exchange trade time (T) -> event time (E)",
+    'event_to_recv': "Exchange event (E) -> socket receive",
+    'recv_to_parse': "Socket receive -> parse done",
+    'parse_to_buffer': "Parse done -> memory buffer append",
+    'buffer_to_commit': "Buffer append -> SQLite commit",
+    'event_to_commit': "Exchange event (E) -> SQLite commit",
+    'buffer_to_analytics': "Newest buffer append -> analytics consumption",
+    'event_to_analytics': "Exchange event (E) -> analytics consumption",
+}
+
+class LatencyHistogram:
+    """
+    Log-linear histogram over integer microseconds (HDR-style).
+    Values below SUB_BUCKETS are exact; above that each power-of-two range is
+    split into SUB_BUCKETS linear buckets, bounding relative error to ~1.6%.
+    Negative values (clock skew between exchange and host) are clamped to 0
+    and counted separately.
+    """
+    SUB_BITS = 6
+    SUB_BUCKETS = 1 << SUB_BITS
+    MAX_EXPONENT = 40
+
+    def __init__(self):
+        self.counts = [0] * (self.SUB_BUCKETS * (self.MAX_EXPONENT + 1))
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self.negative = 0
+
+    def _index(self, v):
+        if v < self.SUB_BUCKETS:
+            return v
+        e = v.bit_length() - self.SUB_BITS - 1
+        return self.SUB_BUCKETS + e * self.SUB_BUCKETS + ((v >> e) - self.SUB_BUCKETS)
+
+    def _value_at(self, idx):
+        # Midpoint of the bucket
+        if idx < self.SUB_BUCKETS:
+            return idx
+        e, sub = divmod(idx - self.SUB_BUCKETS, self.SUB_BUCKETS)
+        low = (sub + self.SUB_BUCKETS) << e
+        return low + ((1 << e) >> 1)
+
+    def record(self, seconds):
+        v = int(seconds * 1e6)
+        if v < 0:
+            self.negative += 1
+            v = 0
+        idx = self._index(v)
+        if idx >= len(self.counts):
+            idx = len(self.counts) - 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.total_us += v
+        if v > self.max_us:
+            self.max_us = v
+
+    def percentile(self, q):
+        """Value (microseconds) at percentile q in [0, 100]."""
+        if self.count == 0:
+            return 0
+        target = max(1, int(self.count * q / 100.0 + 0.5))
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= target:
+                    return min(self._value_at(idx), self.max_us)
+        return self.max_us
+
+    def summary(self) -> dict:
+        """Count and p50/p90/p99/max/mean in milliseconds."""
+        return {
+            'count': self.count,
+            'p50_ms': self.percentile(50) / 1000.0,
+            'p90_ms': self.percentile(90) / 1000.0,
+            'p99_ms': self.percentile(99) / 1000.0,
+            'max_ms': self.max_us / 1000.0,
+            'mean_ms': (self.total_us / self.count / 1000.0) if self.count else 0.0,
+            'negative': self.negative,
+        }
+
+class LatencyTracker:
+    """Thread-safe set of per-stage histograms (see STAGES)."""
+    def __init__(self, stages=STAGES):
+        self.lock = Lock()
+        self.histograms = {name: LatencyHistogram() for name in stages}
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.histograms[stage].record(seconds)
+
+    def record_many(self, stage, values):
+        with self.lock:
+            hist = self.histograms[stage]
+            for v in values:
+                hist.record(v)
+
+    def record_tick(self, pairs):
+        """Record several (stage, seconds) samples under one lock acquisition."""
+        with self.lock:
+            for stage, seconds in pairs:
+                self.histograms[stage].record(seconds)
+
+    def reset(self):
+        with self.lock:
+            for hist in self.histograms.values():
+                hist.reset()
+
+    def summary(self) -> dict:
+        with self.lock:
+            return {name: hist.summary() for name, hist in self.histograms.items()}
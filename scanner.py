@@ -0,0 +1,213 @@
+﻿"""
+Multi-pair cointegration scanner.
+Builds one aligned close-price matrix (bars x symbols) from the store's
+OHLCV bars, then evaluates every N*(N-1)/2 pair on a process pool:
+correlation, OLS hedge ratio, spread half-life and ADF p-value. Pairs are
+ranked (most stationary spread first) and cached per time bucket; the
+headless job persists each bucket's ranking to the tick database, where
+the dashboard's scanner tab reads it.
+
+Pairs are oriented by universe order: x = earlier symbol, y = later symbol.
+
+Usage:
+    python scanner.py                  # headless: rescan every bucket alongside the dashboard
+    python scanner.py --once --top 20  # single scan, print the ranking
+"""
+import argparse
+import itertools
+import math
+import os
+import sqlite3
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.stattools import adfuller
+import config
+
+SCAN_COLUMNS = ['sym_x', 'sym_y', 'n_obs', 'corr', 'beta', 'alpha', 'half_life', 'adf_stat', 'adf_p']
+
+# Worker-global price matrix, installed once per pool worker by _init_worker
+_prices = None
+
+def _init_worker(prices):
+    global _prices
+    _prices = prices
+
+def pair_stats(x, y, min_obs=config.SCANNER_MIN_BARS, adf_maxlag=config.SCANNER_ADF_MAXLAG):
+    """
+    (n_obs, corr, beta, alpha, half_life, adf_stat, adf_p) for y regressed on x
+    over their common rows, or None if there are fewer than min_obs of them.
+    half_life is in bars (inf when the spread does not mean-revert).
+    """
+    ok = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[ok], y[ok]
+    n = len(x)
+    if n < min_obs:
+        return None
+    dx, dy = x - x.mean(), y - y.mean()
+    sxx, syy, sxy = dx @ dx, dy @ dy, dx @ dy
+    if sxx <= 0 or syy <= 0:
+        return None
+    corr = sxy / math.sqrt(sxx * syy)
+    beta = sxy / sxx
+    alpha = y.mean() - beta * x.mean()
+    spread = y - (beta * x + alpha)
+
+    # Ornstein-Uhlenbeck speed from d(spread) ~ lambda * spread_lag
+    lag = spread[:-1] - spread[:-1].mean()
+    lam = (lag @ np.diff(spread)) / (lag @ lag) if lag @ lag > 0 else 0.0
+    half_life = -math.log(2) / lam if lam < 0 else math.inf
+
+    try:
+        with warnings.catch_warnings():
+            # Newer statsmodels warn about the tuple return type on every call
+            warnings.simplefilter('ignore', FutureWarning)
+            adf_stat, adf_p = adfuller(spread, maxlag=adf_maxlag, autolag=None)[:2]
+    except Exception:
+        adf_stat, adf_p = math.nan, math.nan
+    return n, corr, beta, alpha, half_life, adf_stat, adf_p
+
+def _scan_pairs(pairs, min_obs, adf_maxlag):
+    out = []
+    for i, j in pairs:
+        stats = pair_stats(_prices[:, i], _prices[:, j], min_obs, adf_maxlag)
+        if stats is not None:
+            out.append((i, j) + stats)
+    return out
+
+class PairScanner:
+    """
+    Screens every pair of `symbols` over the last `lookback_bars` bars of
+    `interval`. scan() results are cached per `bucket_s` time bucket.
+    """
+
+    def __init__(self, store, symbols=None, interval=config.SCANNER_INTERVAL,
+                 lookback_bars=config.SCANNER_LOOKBACK_BARS, bucket_s=config.SCANNER_BUCKET_S,
+                 workers=config.SCANNER_WORKERS):
+        self.store = store
+        self.symbols = list(symbols or store.symbols)
+        self.interval = interval
+        self.lookback_bars = int(lookback_bars)
+        self.bucket_s = bucket_s
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = {}
+
+    def price_matrix(self, end=None) -> pd.DataFrame:
+        """Close prices, one column per symbol, quiet bars carried forward."""
+        bar_s = config.BAR_INTERVALS[self.interval]
+        start = None if end is None else end - self.lookback_bars * bar_s
+        bars = self.store.get_bars(self.symbols, self.interval, start, end)
+        if bars.empty:
+            return pd.DataFrame(columns=self.symbols)
+        wide = bars.pivot(columns='symbol', values='close').reindex(columns=self.symbols)
+        return wide.ffill().tail(self.lookback_bars)
+
+    def scan(self, end=None) -> pd.DataFrame:
+        """Ranked pair statistics for the bucket containing `end` (default: now)."""
+        end = time.time() if end is None else end
+        bucket = math.floor(end / self.bucket_s) * self.bucket_s
+        if bucket in self.cache:
+            return self.cache[bucket]
+
+        prices = self.price_matrix(bucket)
+        values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+        pairs = list(itertools.combinations(range(len(self.symbols)), 2))
+        args = (config.SCANNER_MIN_BARS, config.SCANNER_ADF_MAXLAG)
+
+        rows = []
+        if self.workers <= 1 or len(pairs) < 2 * self.workers:
+            _init_worker(values)
+            rows = _scan_pairs(pairs, *args)
+        else:
+            from sweep import _start_context  # fork is unsafe next to the store's writer thread
+
+            # Each worker receives the matrix once (initializer), then only pair indices
+            n_chunks = self.workers * 4
+            chunks = [pairs[k::n_chunks] for k in range(n_chunks) if pairs[k::n_chunks]]
+            with ProcessPoolExecutor(self.workers, mp_context=_start_context(),
+                                     initializer=_init_worker, initargs=(values,)) as pool:
+                for part in pool.map(_scan_pairs, chunks, *[[a] * len(chunks) for a in args]):
+                    rows.extend(part)
+
+        results = pd.DataFrame(
+            [(self.symbols[r[0]], self.symbols[r[1]]) + r[2:] for r in rows], columns=SCAN_COLUMNS
+        )
+        results = results.sort_values(['adf_p', 'half_life'], kind='mergesort').reset_index(drop=True)
+        results.insert(0, 'rank', np.arange(1, len(results) + 1))
+        results.attrs['bucket'] = bucket
+
+        self.cache = {b: r for b, r in self.cache.items() if b > bucket - 4 * self.bucket_s}
+        self.cache[bucket] = results
+        return results
+
+    def save(self, results):
+        """Persist one bucket's ranking to the store's database (pair_scans table)."""
+        bucket = results.attrs['bucket']
+        conn = sqlite3.connect(self.store.db_name, timeout=30)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pair_scans (
+                    bucket REAL, interval TEXT, rank INTEGER, sym_x TEXT, sym_y TEXT, n_obs INTEGER,
+                    corr REAL, beta REAL, alpha REAL, half_life REAL, adf_stat REAL, adf_p REAL,
+                    PRIMARY KEY (bucket, interval, sym_x, sym_y)
+                )
+            """)
+            with conn:
+                conn.execute("DELETE FROM pair_scans WHERE bucket = ? AND interval = ?", (bucket, self.interval))
+                conn.executemany(
+                    f"INSERT INTO pair_scans VALUES ({', '.join('?' * (len(SCAN_COLUMNS) + 3))})",
+                    [(bucket, self.interval) + tuple(row) for row in results.itertuples(index=False)]
+                )
+        finally:
+            conn.close()
+
+def load_latest_scan(db_name=config.DB_NAME, interval=config.SCANNER_INTERVAL) -> pd.DataFrame:
+    """Most recent persisted ranking (empty if the scanner has not run)."""
+    conn = sqlite3.connect(db_name)
+    try:
+        df = pd.read_sql_query(
+            "SELECT * FROM pair_scans WHERE interval = ? AND bucket = "
+            "(SELECT MAX(bucket) FROM pair_scans WHERE interval = ?) ORDER BY rank",
+            conn, params=(interval, interval)
+        )
+    except Exception:
+        return pd.DataFrame()
+    finally:
+        conn.close()
+    if not df.empty:
+        df.attrs['bucket'] = df['bucket'].iloc[0]
+    return df.drop(columns=['bucket', 'interval'])
+
+def main():
+    from storage import TradeStore
+
+    parser = argparse.ArgumentParser(description="Screen every symbol pair for cointegration")
+    parser.add_argument('--db', default=config.DB_NAME)
+    parser.add_argument('--symbols', help="Comma-separated universe (default: config.SYMBOLS)")
+    parser.add_argument('--interval', default=config.SCANNER_INTERVAL, choices=list(config.BAR_INTERVALS))
+    parser.add_argument('--lookback', type=int, default=config.SCANNER_LOOKBACK_BARS, help="Bars per scan")
+    parser.add_argument('--workers', type=int, default=config.SCANNER_WORKERS)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--once', action='store_true', help="Scan once and exit")
+    args = parser.parse_args()
+
+    symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()] if args.symbols else config.SYMBOLS
+    store = TradeStore(db_name=args.db, symbols=symbols, read_only=True)
+    scanner = PairScanner(store, symbols, args.interval, args.lookback, workers=args.workers)
+    while True:
+        t0 = time.perf_counter()
+        results = scanner.scan()
+        scanner.save(results)
+        stamp = pd.to_datetime(results.attrs['bucket'], unit='s')
+        print(f"[Scanner] {stamp}: {len(results)} pairs ranked in {time.perf_counter() - t0:.2f}s")
+        if not results.empty:
+            print(results.head(args.top).to_string(index=False))
+        if args.once:
+            break
+        time.sleep(max(1.0, results.attrs['bucket'] + scanner.bucket_s - time.time()))
+    store.close()
+
+if __name__ == "__main__":
+    main()
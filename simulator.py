@@ -0,0 +1,353 @@
+﻿"""
+Local Binance Futures aggTrade WebSocket simulator (offline load testing).
+
+Serves combined-stream frames ({"stream": ..., "data": {...aggTrade...}}) in the
+same shape as fstream.binance.com, so BinanceStreamer can be driven without
+touching the exchange.
+
+Usage:
+    python simulator.py serve --rate 2000 --model cointegrated --burst-every 10
+    BINANCE_WS_URL="ws://localhost:8765/stream?streams=" streamlit run app.py
+
+    python simulator.py record --out frames.jsonl --seconds 60     # from real Binance
+    python simulator.py replay frames.jsonl --speed 10              # 10x real time
+    python simulator.py loadtest --rate 5000 --seconds 10           # end-to-end ticks/sec
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+from websockets.asyncio.server import serve
+
+import config
+
+# Rough reference prices so simulated pairs look like the real ones
+BASE_PRICES = {"BTCUSDT": 60000.0, "ETHUSDT": 3000.0, "SOLUSDT": 150.0, "BNBUSDT": 550.0}
+
+class PriceGenerator:
+    """
+    Synthetic tick source.
+    - 'random-walk': independent geometric random walks per symbol.
+    - 'cointegrated': the first symbol is a random walk; every other symbol is
+      log(p) = c + beta * log(p_first) + s, where s is a mean-reverting OU spread.
+    """
+    def __init__(self, symbols, model='cointegrated', vol=2e-4, beta=1.0,
+                 kappa=0.01, spread_vol=2e-4, seed=None):
+        self.symbols = [s.upper() for s in symbols]
+        self.model = model
+        self.vol = vol
+        self.beta = beta
+        self.kappa = kappa
+        self.spread_vol = spread_vol
+        self.rng = random.Random(seed)
+
+        self.base_log = {s: math.log(BASE_PRICES.get(s, 100.0)) for s in self.symbols}
+        self.log_price = dict(self.base_log)
+        self.ou = {s: 0.0 for s in self.symbols}
+        self.agg_id = {s: 1 for s in self.symbols}
+
+    def next_trade(self, symbol):
+        """Advance the model by one trade on `symbol`. Returns (price, qty, agg_id)."""
+        lead = self.symbols[0]
+        if self.model == 'cointegrated' and symbol != lead:
+            # Mean-reverting spread around the lead leg
+            self.ou[symbol] += -self.kappa * self.ou[symbol] + self.rng.gauss(0.0, self.spread_vol)
+            drift = self.log_price[lead] - self.base_log[lead]
+            self.log_price[symbol] = self.base_log[symbol] + self.beta * drift + self.ou[symbol]
+        else:
+            self.log_price[symbol] += self.rng.gauss(0.0, self.vol)
+
+        qty = round(self.rng.expovariate(1.0 / 0.05), 3) or 0.001
+        agg_id = self.agg_id[symbol]
+        self.agg_id[symbol] += 1
+        return math.exp(self.log_price[symbol]), qty, agg_id
+
+def make_frame(symbol, price, qty, agg_id, now_ms):
+    """Serialize one combined-stream aggTrade frame."""
+    return json.dumps({
+        "stream": f"{symbol.lower()}@aggTrade",
+        "data": {
+            "e": "aggTrade", "E": now_ms, "a": agg_id, "s": symbol,
+            "p": f"{price:.2f}", "q": f"{qty:.3f}",
+            "f": agg_id, "l": agg_id, "T": now_ms, "m": False
+        }
+    }, separators=(',', ':'))
+
+class EventClock:
+    """
+    Per-symbol event timestamps in ms. The store keys ticks on (timestamp, symbol),
+    so a symbol's stamp always moves forward by at least 1 ms; above 1000 frames/s
+    on one symbol it runs ahead of the wall clock.
+    """
+    def __init__(self):
+        self.last = {}
+
+    def stamp(self, symbol, ms):
+        ms = max(int(ms), self.last.get(symbol, -1) + 1)
+        self.last[symbol] = ms
+        return ms
+
+def requested_symbols(path, default):
+    """Symbols from a '/stream?streams=btcusdt@aggTrade/ethusdt@aggTrade' request path."""
+    streams = parse_qs(urlparse(path).query).get('streams', [''])[0]
+    symbols = [s.split('@')[0].upper() for s in streams.split('/') if s]
+    return symbols or [s.upper() for s in default]
+
+class SimulatorServer:
+    """
+    asyncio WebSocket server emitting synthetic or replayed frames.
+    Rate is frames/sec per connection; during a burst it is multiplied by
+    `burst_multiplier`. With `disconnect_every` set, each connection is
+    closed after that many seconds to exercise reconnect logic.
+    """
+    def __init__(self, host='localhost', port=8765, rate=500.0, model='cointegrated',
+                 burst_every=0.0, burst_duration=1.0, burst_multiplier=10.0,
+                 disconnect_every=0.0, replay_path=None, speed=1.0,
+                 keep_timestamps=False, seed=None):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.model = model
+        self.burst_every = burst_every
+        self.burst_duration = burst_duration
+        self.burst_multiplier = burst_multiplier
+        self.disconnect_every = disconnect_every
+        self.replay_path = replay_path
+        self.speed = speed
+        self.keep_timestamps = keep_timestamps
+        self.seed = seed
+
+        self.frames_sent = 0
+        self.connections = 0
+        self.loop = None
+        self._stop = None
+
+    def _current_rate(self, elapsed):
+        if self.burst_every > 0 and (elapsed % self.burst_every) < self.burst_duration:
+            return self.rate * self.burst_multiplier
+        return self.rate
+
+    async def _send_synthetic(self, ws, symbols, started):
+        gen = PriceGenerator(symbols, model=self.model, seed=self.seed)
+        clock = EventClock()
+        due = 0.0
+        last = time.monotonic()
+        last_ms = time.time() * 1000
+        while True:
+            now = time.monotonic()
+            if self.disconnect_every > 0 and now - started >= self.disconnect_every:
+                print(f"[SIM] Dropping connection after {self.disconnect_every:.0f}s")
+                return
+            due += (now - last) * self._current_rate(now - started)
+            last = now
+
+            n = int(due)
+            due -= n
+            now_ms = time.time() * 1000
+            step = (now_ms - last_ms) / n if n else 0.0
+            for k in range(n):
+                # Spread this iteration's frames over the time since the previous one
+                sym = symbols[gen.rng.randrange(len(symbols))]
+                price, qty, agg_id = gen.next_trade(sym)
+                await ws.send(make_frame(sym, price, qty, agg_id, clock.stamp(sym, last_ms + step * (k + 1))))
+            last_ms = now_ms
+            self.frames_sent += n
+            await asyncio.sleep(0.005)
+
+    async def _send_replay(self, ws, symbols, started):
+        wanted = {f"{s.lower()}@aggTrade" for s in symbols}
+        with open(self.replay_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if not records:
+            return
+
+        t0_rec = records[0]['t']
+        t0_wall = time.time()
+        clock = EventClock()
+        for rec in records:
+            frame = rec['frame']
+            msg = json.loads(frame)
+            if msg.get('stream') not in wanted:
+                continue
+
+            if self.speed > 0:
+                delay = (rec['t'] - t0_rec) / self.speed - (time.time() - t0_wall)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if not self.keep_timestamps:
+                # Re-stamp as if the trade happened now, so latency stats stay meaningful
+                now_ms = clock.stamp(msg['data'].get('s'), time.time() * 1000)
+                msg['data']['E'] = now_ms
+                msg['data']['T'] = now_ms
+                frame = json.dumps(msg, separators=(',', ':'))
+
+            await ws.send(frame)
+            self.frames_sent += 1
+            if self.disconnect_every > 0 and time.monotonic() - started >= self.disconnect_every:
+                print(f"[SIM] Dropping connection after {self.disconnect_every:.0f}s")
+                return
+        print("[SIM] Replay finished")
+
+    async def _handler(self, ws):
+        symbols = requested_symbols(ws.request.path, config.SYMBOLS)
+        self.connections += 1
+        print(f"[SIM] Client connected: {', '.join(symbols)}")
+        started = time.monotonic()
+        try:
+            if self.replay_path:
+                await self._send_replay(ws, symbols, started)
+            else:
+                await self._send_synthetic(ws, symbols, started)
+        except Exception as e:
+            print(f"[SIM] Connection ended: {e}")
+
+    async def serve_forever(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve(self._handler, self.host, self.port, compression=None):
+            print(f"[SIM] Listening on ws://{self.host}:{self.port}/stream?streams=")
+            await self._stop.wait()
+
+    def start_in_thread(self):
+        """Run the server on a daemon thread (used by the load test)."""
+        t = threading.Thread(target=lambda: asyncio.run(self.serve_forever()), daemon=True)
+        t.start()
+        while self.loop is None:
+            time.sleep(0.01)
+        return t
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/stream?streams="
+
+def record(out_path, seconds, symbols=config.SYMBOLS, url=config.BINANCE_WS_URL):
+    """Record raw frames from a live endpoint as JSONL: {"t": recv_time, "frame": raw}."""
+    import websocket
+
+    streams = "/".join(f"{s.lower()}@aggTrade" for s in symbols)
+    ws = websocket.create_connection(f"{url}{streams}", timeout=5)
+    deadline = time.time() + seconds
+    count = 0
+    with open(out_path, 'w', encoding='utf-8') as f:
+        while time.time() < deadline:
+            try:
+                frame = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            f.write(json.dumps({"t": time.time(), "frame": frame}) + "\n")
+            count += 1
+    ws.close()
+    print(f"[SIM] Recorded {count} frames to {out_path}")
+
+def loadtest(seconds, symbols=config.SYMBOLS, engine=config.INGEST_ENGINE, **server_kwargs):
+    """
+    Run simulator + BinanceStreamer + TradeStore in one process and report
+    end-to-end frames sent vs ticks ingested per second, plus per-stage latency.
+    """
+    from storage import TradeStore
+    from ingest import create_streamer
+
+    server = SimulatorServer(**server_kwargs)
+    server.start_in_thread()
+    config.BINANCE_WS_URL = server.url
+    config.INGEST_ENGINE = engine
+
+    db_path = os.path.join(tempfile.mkdtemp(), "loadtest.db")
+    store = TradeStore(db_name=db_path, symbols=symbols)
+    streamer = create_streamer(store, symbols)
+    streamer.start()
+
+    t0 = time.time()
+    time.sleep(seconds)
+    streamer.stop()
+    sent = server.frames_sent
+    elapsed = time.time() - t0
+
+    store.flush()
+    stats = store.get_writer_stats()
+    latency = store.get_latency_stats()
+    server.stop()
+    store.close()
+
+    ingested = stats['rows_written'] + stats['rows_ignored'] + stats['dropped']
+    print(f"[SIM] {elapsed:.1f}s | sent {sent} ({sent / elapsed:,.0f}/s) | "
+          f"ingested {ingested} ({ingested / elapsed:,.0f}/s) | "
+          f"persisted {stats['rows_written']} | duplicates ignored {stats['rows_ignored']} | dropped {stats['dropped']}")
+    print(f"[SIM] Writer: avg batch {stats['avg_batch_size']:.0f}, "
+          f"avg commit {stats['avg_commit_ms']:.2f} ms, max commit {stats['max_commit_ms']:.2f} ms")
+    for stage, lat in latency.items():
+        if lat['count']:
+            print(f"[SIM] {stage:<20} p50 {lat['p50_ms']:8.3f} ms | p99 {lat['p99_ms']:8.3f} ms | max {lat['max_ms']:8.3f} ms")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Binance aggTrade WebSocket simulator")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    def add_server_args(p):
+        p.add_argument('--host', default='localhost')
+        p.add_argument('--port', type=int, default=8765)
+        p.add_argument('--rate', type=float, default=500.0, help="Frames/sec per connection")
+        p.add_argument('--model', choices=['random-walk', 'cointegrated'], default='cointegrated')
+        p.add_argument('--burst-every', type=float, default=0.0, help="Seconds between bursts (0 = off)")
+        p.add_argument('--burst-duration', type=float, default=1.0)
+        p.add_argument('--burst-multiplier', type=float, default=10.0)
+        p.add_argument('--disconnect-every', type=float, default=0.0, help="Drop each connection after N seconds")
+        p.add_argument('--seed', type=int, default=None)
+
+    p_serve = sub.add_parser('serve', help="Serve synthetic frames")
+    add_server_args(p_serve)
+
+    p_replay = sub.add_parser('replay', help="Replay recorded frames")
+    p_replay.add_argument('path')
+    p_replay.add_argument('--speed', type=float, default=1.0, help="Playback speed multiplier (0 = as fast as possible)")
+    p_replay.add_argument('--keep-timestamps', action='store_true', help="Do not re-stamp E/T with the current time")
+    p_replay.add_argument('--host', default='localhost')
+    p_replay.add_argument('--port', type=int, default=8765)
+    p_replay.add_argument('--disconnect-every', type=float, default=0.0)
+
+    p_record = sub.add_parser('record', help="Record frames from the live endpoint")
+    p_record.add_argument('--out', required=True)
+    p_record.add_argument('--seconds', type=float, default=60.0)
+    p_record.add_argument('--symbols', nargs='+', default=config.SYMBOLS)
+
+    p_load = sub.add_parser('loadtest', help="Measure end-to-end ingest throughput")
+    add_server_args(p_load)
+    p_load.add_argument('--seconds', type=float, default=10.0)
+    p_load.add_argument('--symbols', nargs='+', default=config.SYMBOLS)
+    p_load.add_argument('--num-symbols', type=int, default=0, help="Generate N synthetic symbols instead of --symbols")
+    p_load.add_argument('--engine', choices=['asyncio', 'thread'], default=config.INGEST_ENGINE)
+
+    args = parser.parse_args()
+    if args.cmd == 'record':
+        record(args.out, args.seconds, args.symbols)
+        return
+
+    kwargs = {k: v for k, v in vars(args).items()
+              if k not in ('cmd', 'seconds', 'path', 'symbols', 'num_symbols', 'engine')}
+    if args.cmd == 'replay':
+        kwargs['replay_path'] = args.path
+    if args.cmd == 'loadtest':
+        symbols = args.symbols
+        if args.num_symbols:
+            symbols = [f"SYM{i:03d}USDT" for i in range(args.num_symbols)]
+        loadtest(args.seconds, symbols=symbols, engine=args.engine, **kwargs)
+        return
+    try:
+        asyncio.run(SimulatorServer(**kwargs).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
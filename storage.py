@@ -1,31 +1,503 @@
 ﻿import sqlite3
+import queue
+import threading
+import time
+import atexit
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from collections import deque
 from threading import Lock
 import config
+from latency import LatencyTracker
+from archive import TickArchive, archive_dir
+from journal import TickJournalSet
+
+# Merge a (possibly partial) bar into an existing row for the same (symbol, start)
+BAR_UPSERT_SQL = """
+    INSERT INTO {table} (symbol, start, open, high, low, close, volume, notional, trades, last_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(symbol, start) DO UPDATE SET
+        high = MAX(high, excluded.high),
+        low = MIN(low, excluded.low),
+        close = CASE WHEN excluded.last_ts >= last_ts THEN excluded.close ELSE close END,
+        last_ts = MAX(last_ts, excluded.last_ts),
+        volume = volume + excluded.volume,
+        notional = notional + excluded.notional,
+        trades = trades + excluded.trades
+"""
+
+# pandas-style resample rules -> bar table names
+BAR_ALIASES = {'1s': '1s', '1S': '1s', '1min': '1m', '1T': '1m', '5min': '5m', '5T': '5m', '1h': '1h', '1H': '1h'}
+
+class TickRingBuffer:
+    """
+    Fixed-capacity columnar ring buffer for one symbol.
+    Timestamp/price/size live in preallocated float64 arrays; `head` is the
+    next write slot. Appends are O(1) and allocation-free, and ordered reads
+    are at most two contiguous slices of the underlying arrays.
+    `total` counts every tick ever appended and serves as a read cursor.
+    Not thread-safe on its own: TradeStore guards it with its lock.
+    """
+    def __init__(self, capacity=config.MEMORY_BUFFER_SIZE):
+        self.capacity = int(capacity)
+        self.timestamp = np.empty(self.capacity, dtype=np.float64)
+        self.price = np.empty(self.capacity, dtype=np.float64)
+        self.size = np.empty(self.capacity, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.total = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp: float, price: float, size: float):
+        i = self.head
+        self.timestamp[i] = timestamp
+        self.price[i] = price
+        self.size[i] = size
+        self.head = i + 1 if i + 1 < self.capacity else 0
+        self.total += 1
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, timestamp, price, size):
+        """Bulk append of equal-length arrays: at most two slice copies per column."""
+        k = len(timestamp)
+        if k == 0:
+            return
+        self.total += k
+        if k > self.capacity:
+            timestamp, price, size = timestamp[-self.capacity:], price[-self.capacity:], size[-self.capacity:]
+            k = self.capacity
+        i = self.head
+        first = min(k, self.capacity - i)
+        for dst, src in ((self.timestamp, timestamp), (self.price, price), (self.size, size)):
+            dst[i:i + first] = src[:first]
+            if k > first:
+                dst[:k - first] = src[first:]
+        self.head = (i + k) % self.capacity
+        self.count = min(self.capacity, self.count + k)
+
+    def segments(self):
+        """
+        Oldest-to-newest data as a list of (timestamp, price, size) view
+        tuples: one segment before the buffer wraps, two after.
+        """
+        if self.count == 0:
+            return []
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            end = start + self.count
+            return [(self.timestamp[start:end], self.price[start:end], self.size[start:end])]
+        return [
+            (self.timestamp[start:], self.price[start:], self.size[start:]),
+            (self.timestamp[:self.head], self.price[:self.head], self.size[:self.head]),
+        ]
+
+    def to_arrays(self):
+        """Ordered copies of (timestamp, price, size)."""
+        segs = self.segments()
+        if not segs:
+            empty = np.empty(0, dtype=np.float64)
+            return empty, empty.copy(), empty.copy()
+        if len(segs) == 1:
+            return tuple(col.copy() for col in segs[0])
+        return tuple(np.concatenate([a, b]) for a, b in zip(*segs))
+
+    def since(self, cursor=0, copy=True):
+        """
+        Ticks appended at or after sequence number `cursor` (clamped to the
+        oldest tick still buffered) as ((timestamp, price, size), new_cursor).
+        With copy=False a tail that does not straddle the wrap point is
+        returned as views, valid only until the buffer overwrites them.
+        """
+        n = min(self.total - max(cursor, 0), self.count)
+        if n <= 0:
+            empty = np.empty(0, dtype=np.float64)
+            return (empty, empty.copy(), empty.copy()), self.total
+        end = self.head if self.head else self.capacity
+        start = end - n
+        if start >= 0:
+            cols = (self.timestamp[start:end], self.price[start:end], self.size[start:end])
+            if copy:
+                cols = tuple(col.copy() for col in cols)
+        else:
+            cols = tuple(
+                np.concatenate([col[start:], col[:end]])
+                for col in (self.timestamp, self.price, self.size)
+            )
+        return cols, self.total
+
+def merge_tick_arrays(arrays):
+    """
+    Linear k-way merge of per-symbol, time-ordered tick arrays.
+    arrays: {symbol: (timestamp, price, size)}.
+    Returns {'timestamp', 'price', 'size', 'symbol'} where 'symbol' holds
+    integer codes into the list stored under 'symbols'. Streams are merged
+    pairwise with searchsorted, so no global sort is performed; ties keep
+    the input symbol order.
+    """
+    symbols = list(arrays)
+    streams = [
+        (np.asarray(ts), np.asarray(price), np.asarray(size), np.full(len(ts), code, dtype=np.int32))
+        for code, (ts, price, size) in enumerate(arrays.values())
+    ]
+    if not streams:
+        empty = np.empty(0, dtype=np.float64)
+        return {'timestamp': empty, 'price': empty.copy(), 'size': empty.copy(),
+                'symbol': np.empty(0, dtype=np.int32), 'symbols': symbols}
+
+    def merge2(a, b):
+        # Output slot of each row of b: its rank in a plus its own position
+        pos_b = np.searchsorted(a[0], b[0], side='right') + np.arange(len(b[0]))
+        n = len(a[0]) + len(b[0])
+        mask = np.ones(n, dtype=bool)
+        mask[pos_b] = False
+        out = []
+        for col_a, col_b in zip(a, b):
+            col = np.empty(n, dtype=col_a.dtype)
+            col[mask] = col_a
+            col[pos_b] = col_b
+            out.append(col)
+        return tuple(out)
+
+    # Balanced pairwise reduction: O(n log k) total work
+    while len(streams) > 1:
+        streams = [
+            merge2(streams[i], streams[i + 1]) if i + 1 < len(streams) else streams[i]
+            for i in range(0, len(streams), 2)
+        ]
+    ts, price, size, code = streams[0]
+    return {'timestamp': ts, 'price': price, 'size': size, 'symbol': code, 'symbols': symbols}
+
+class BarAggregator:
+    """
+    Incremental OHLCV bars per (interval, symbol), fed by the disk writer.
+    Each symbol keeps one open bar per interval:
+    [start, open, high, low, close, volume, notional, trades, last_ts]
+    (VWAP = notional / volume). A bar closes when a tick for a later bar
+    arrives; closed bars are returned for persistence. Late ticks for an
+    already closed bar are emitted as a partial bar and merged by the upsert.
+    """
+    COLUMNS = ['symbol', 'start', 'open', 'high', 'low', 'close', 'volume', 'notional', 'trades', 'last_ts']
+
+    def __init__(self, intervals=config.BAR_INTERVALS):
+        self.intervals = dict(intervals)
+        self.lock = Lock()
+        self.open_bars = {name: {} for name in self.intervals}
+
+    def add(self, rows) -> dict:
+        """Fold (timestamp, symbol, price, size, ...) rows in. Returns {interval: [closed bar tuples]}."""
+        closed = {name: [] for name in self.intervals}
+        with self.lock:
+            for name, secs in self.intervals.items():
+                bars = self.open_bars[name]
+                out = closed[name]
+                for row in rows:
+                    ts, sym, price, size = row[0], row[1], row[2], row[3]
+                    start = (ts // secs) * secs
+                    bar = bars.get(sym)
+                    if bar is None or start > bar[0]:
+                        if bar is not None:
+                            out.append((sym, *bar))
+                        bars[sym] = [start, price, price, price, price, size, price * size, 1, ts]
+                    elif start == bar[0]:
+                        if price > bar[2]: bar[2] = price
+                        if price < bar[3]: bar[3] = price
+                        if ts >= bar[8]:
+                            bar[4] = price
+                            bar[8] = ts
+                        bar[5] += size
+                        bar[6] += price * size
+                        bar[7] += 1
+                    else:
+                        out.append((sym, start, price, price, price, price, size, price * size, 1, ts))
+        return closed
+
+    def checkpoint(self) -> dict:
+        """Copy of the open-bar state, for restore() if the batch it precedes is rolled back."""
+        with self.lock:
+            return {name: {sym: list(bar) for sym, bar in bars.items()} for name, bars in self.open_bars.items()}
+
+    def restore(self, state):
+        with self.lock:
+            self.open_bars = state
+
+    def drain(self) -> dict:
+        """Close every open bar (used on shutdown so partial bars are persisted)."""
+        with self.lock:
+            closed = {
+                name: [(sym, *bar) for sym, bar in bars.items()]
+                for name, bars in self.open_bars.items()
+            }
+            for bars in self.open_bars.values():
+                bars.clear()
+        return closed
+
+    def snapshot(self, interval, symbols) -> list:
+        """Copies of the currently open bars for `symbols`."""
+        with self.lock:
+            bars = self.open_bars[interval]
+            return [(sym, *bars[sym]) for sym in symbols if sym in bars]
+
+    def clear(self):
+        with self.lock:
+            for bars in self.open_bars.values():
+                bars.clear()
+
+class TickWriter(threading.Thread):
+    """
+    Write-behind persistence thread.
+    Producers enqueue rows without touching SQLite; this thread owns a single
+    connection and commits them with executemany, one transaction per batch.
+    A batch is flushed when it reaches `batch_size` rows or when its oldest
+    row has waited `flush_interval` seconds.
+    Rows are (timestamp, symbol, price, size, append_time); the last field
+    only feeds the optional latency tracker and is not persisted.
+    Each batch also updates the BarAggregator with the rows it inserts
+    (keys already stored or repeated in the batch are not counted); bars it
+    closes are upserted into the bars_<interval> tables in the same
+    transaction, and the aggregator is rolled back with it on failure.
+    """
+    _STOP = object()
+
+    def __init__(self, db_name, max_queue=config.DB_WRITE_QUEUE_SIZE,
+                 batch_size=config.DB_WRITE_BATCH_SIZE, flush_interval=config.DB_FLUSH_INTERVAL_S,
+                 latency=None, bars=None):
+        super().__init__(name="TickWriter")
+        self.db_name = db_name
+        self.latency = latency
+        self.bars = bars
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.daemon = True
+
+        # Counters (written only by this thread, except `dropped`)
+        self.stats_lock = Lock()
+        self.dropped = 0
+        self.rows_written = 0   # Rows actually inserted into `trades`
+        self.rows_ignored = 0   # Committed rows skipped by INSERT OR IGNORE (duplicate timestamp/symbol)
+        self.batches = 0
+        self.batch_rows = 0     # Rows committed in batches (inserted + ignored)
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self.total_commit_ms = 0.0
+        self.errors = 0
+
+    def submit(self, row: tuple):
+        """Non-blocking enqueue. Drops (and counts) the row if the queue is full."""
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+
+    def _collect_batch(self, first):
+        """Gather rows until the batch is full or the flush deadline passes."""
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    @staticmethod
+    def _upsert_bars(conn, closed):
+        for name, rows in closed.items():
+            if rows:
+                conn.executemany(BAR_UPSERT_SQL.format(table=f"bars_{name}"), rows)
+
+    @staticmethod
+    def _new_rows(conn, batch):
+        """
+        Rows of `batch` that INSERT OR IGNORE will keep: the first of each
+        (timestamp, symbol) key in the batch that is not already stored.
+        One range read on idx_ts plus a set pass (cheaper than array set
+        operations at batch sizes).
+        """
+        ts = [row[0] for row in batch]
+        seen = set(conn.execute(
+            "SELECT timestamp, symbol FROM trades WHERE timestamp BETWEEN ? AND ?", (min(ts), max(ts))
+        ).fetchall())
+        kept = []
+        for row in batch:
+            key = (row[0], row[1])
+            if key not in seen:
+                seen.add(key)
+                kept.append(row)
+        return kept
+
+    def _write_batch(self, conn, batch):
+        """
+        One transaction: insert the batch with executemany and fold the rows it
+        actually inserted into bars. Returns (rows inserted, those rows).
+        """
+        saved = self.bars.checkpoint() if self.bars is not None else None
+        try:
+            with conn:
+                # Write lock first, so no other connection changes trades between the read and the insert
+                conn.execute("BEGIN IMMEDIATE")
+                before = conn.total_changes
+                kept = self._new_rows(conn, batch) if self.bars is not None else batch
+                conn.executemany(
+                    "INSERT OR IGNORE INTO trades (timestamp, symbol, price, size) VALUES (?, ?, ?, ?)",
+                    [row[:4] for row in kept]
+                )
+                inserted = conn.total_changes - before
+                if self.bars is not None:
+                    self._upsert_bars(conn, self.bars.add(kept))
+            return inserted, kept
+        except Exception:
+            if saved is not None:
+                self.bars.restore(saved)
+            raise
+
+    def _commit(self, conn, batch):
+        t0 = time.perf_counter()
+        for attempt in range(config.DB_BUSY_RETRIES + 1):
+            try:
+                inserted, _ = self._write_batch(conn, batch)
+                break
+            except sqlite3.OperationalError as e:
+                # Another connection (e.g. archive compaction) holds the write lock past the busy timeout
+                if attempt < config.DB_BUSY_RETRIES and ('locked' in str(e) or 'busy' in str(e)):
+                    time.sleep(0.1 * (attempt + 1))
+                    continue
+                error = e
+            except Exception as e:
+                error = e
+            with self.stats_lock:
+                self.errors += 1
+            print(f"[Storage Error] Batch of {len(batch)} failed: {error}")
+            return
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+
+        if self.latency is not None:
+            now = time.time()
+            samples = [('buffer_to_commit', now - row[4]) for row in batch]
+            samples += [('event_to_commit', now - row[0]) for row in batch]
+            self.latency.record_tick(samples)
+
+        with self.stats_lock:
+            self.rows_written += inserted
+            self.rows_ignored += len(batch) - inserted
+            self.batch_rows += len(batch)
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.last_commit_ms = elapsed_ms
+            self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+            self.total_commit_ms += elapsed_ms
+
+    def run(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        try:
+            while True:
+                first = self.queue.get()
+                if first is self._STOP:
+                    self.queue.task_done()
+                    break
+                batch, stop = self._collect_batch(first)
+                self._commit(conn, batch)
+                # Mark every dequeued item (including a trailing sentinel) as done
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self.queue.task_done()
+                if stop:
+                    break
+            if self.bars is not None:
+                with conn:
+                    self._upsert_bars(conn, self.bars.drain())
+        finally:
+            conn.close()
+
+    def flush(self):
+        """Block until every row enqueued so far has been committed."""
+        if self.is_alive():
+            self.queue.join()
+
+    def close(self, timeout=5.0):
+        """Drain pending rows, commit them and stop the thread."""
+        if not self.is_alive():
+            return
+        self.queue.put(self._STOP)
+        self.join(timeout)
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'rows_written': self.rows_written,
+                'rows_ignored': self.rows_ignored,
+                'batches': self.batches,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'last_batch_size': self.last_batch_size,
+                'max_batch_size': self.max_batch_size,
+                'avg_batch_size': self.batch_rows / self.batches if self.batches else 0.0,
+                'last_commit_ms': self.last_commit_ms,
+                'max_commit_ms': self.max_commit_ms,
+                'avg_commit_ms': self.total_commit_ms / self.batches if self.batches else 0.0,
+            }
 
 class TradeStore:
     """
     Hybrid Storage Engine:
-    1. In-Memory Deque (Ring Buffer) for O(1) recent access (Critical for Live Analytics).
-    2. SQLite for persistent historical storage and resampling.
+    1. In-Memory columnar NumPy ring buffer for O(1) recent access (Critical for Live Analytics).
+    2. SQLite for persistent historical storage and resampling, fed by a
+       write-behind TickWriter thread so ingest never waits on disk.
+    3. Optional Parquet archive for closed days, read transparently by query().
+    4. Optional memory-mapped binary journal of raw ticks (journal.py).
+    read_only=True opens the same tiers for queries only (no writer thread or
+    journal), for readers running next to the live ingest process.
     """
+    QUERY_COLUMNS = ('timestamp', 'symbol', 'price', 'size')
     
-    def __init__(self, db_name=config.DB_NAME, symbols=config.SYMBOLS):
+    def __init__(self, db_name=config.DB_NAME, symbols=config.SYMBOLS, read_only=False):
         self.db_name = db_name
         self.symbols = symbols
+        self.read_only = read_only
         self.lock = Lock()
+        self.closed = False
         
-        # In-memory fast buffer: {symbol: deque([...])}
+        # In-memory fast buffer: {symbol: TickRingBuffer}
         self.memory_buffer = {
-            sym: deque(maxlen=config.MEMORY_BUFFER_SIZE) 
+            sym: TickRingBuffer(config.MEMORY_BUFFER_SIZE)
             for sym in symbols
         }
         
+        # Per-stage pipeline latency histograms (exchange -> disk / analytics)
+        self.latency = LatencyTracker() if config.LATENCY_TRACKING else None
+        self.last_append_time = {sym: 0.0 for sym in symbols}
+        
         self._init_db()
 
+        # Raw tick journal: fixed-size records appended through mmap, msync'd periodically
+        self.journal = TickJournalSet(config.JOURNAL_DIR) if config.JOURNAL_ENABLED and not read_only else None
+
+        # Cold tier: closed days rolled out to per-symbol/per-day Parquet (archive.py)
+        self.archive = TickArchive(archive_dir(db_name)) if config.ARCHIVE_ENABLED else None
+
+        # Incrementally maintained OHLCV bars (see BarAggregator / get_bars)
+        self.bars = BarAggregator(config.BAR_INTERVALS)
+        if read_only:
+            self.writer = None
+            return
+        self.writer = TickWriter(db_name, latency=self.latency, bars=self.bars)
+        self.writer.start()
+        atexit.register(self.close)
+
     def _init_db(self):
         """Initialize SQLite with WAL mode for better concurrency."""
         conn = sqlite3.connect(self.db_name)
@@ -45,58 +517,448 @@ class TradeStore:
             )
         """)
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_ts ON trades(timestamp)")
+        # Covering index for per-symbol time-range scans (query API): no table lookups needed
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sym_ts ON trades(symbol, timestamp, price, size)")
+
+        # Pre-aggregated OHLCV bars, one table per interval
+        for name in config.BAR_INTERVALS:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS bars_{name} (
+                    symbol TEXT,
+                    start REAL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume REAL,
+                    notional REAL,
+                    trades INTEGER,
+                    last_ts REAL,
+                    PRIMARY KEY (symbol, start)
+                )
+            """)
         conn.commit()
         conn.close()
 
     def save_tick(self, tick_data: dict):
         """
-        Thread-safe write to both Memory and Disk.
+        Thread-safe write to Memory, queued write to Disk.
         tick_data expected format: {'timestamp': float, 'symbol': str, 'price': float, 'size': float}
+        Optional latency fields (epoch seconds): 'trade_time', 'recv_time', 'parse_time'.
+        """
+        self.save_ticks((tick_data,))
+
+    def save_ticks(self, ticks):
         """
+        Batched save_tick: one lock acquisition for the whole micro-batch.
+        Used by the asyncio ingest engine to hand over parsed ticks in bulk.
+        """
+        if self.read_only:
+            raise RuntimeError(f"TradeStore({self.db_name}) is read-only")
+        rows = []
         with self.lock:
+            if self.closed:
+                return
             # 1. Write to Memory
-            self.memory_buffer[tick_data['symbol']].append(tick_data)
+            append_time = time.time()
+            for tick_data in ticks:
+                symbol = tick_data['symbol']
+                self.memory_buffer[symbol].append(
+                    tick_data['timestamp'], tick_data['price'], tick_data['size']
+                )
+                self.last_append_time[symbol] = append_time
+                rows.append((tick_data['timestamp'], symbol, tick_data['price'], tick_data['size'], append_time))
+
+        if self.journal is not None:
+            by_symbol = {}
+            for tick_data in ticks:
+                by_symbol.setdefault(tick_data['symbol'], []).append(tick_data)
+            for symbol, group in by_symbol.items():
+                self.journal.append(
+                    symbol,
+                    [t['timestamp'] for t in group], [t['price'] for t in group],
+                    [t['size'] for t in group], [t.get('agg_id', -1) for t in group]
+                )
         
-        # 2. Write to Disk (In a real system, this would be batched/async)
-        try:
-            conn = sqlite3.connect(self.db_name)
-            conn.execute(
-                "INSERT OR IGNORE INTO trades (timestamp, symbol, price, size) VALUES (?, ?, ?, ?)",
-                (tick_data['timestamp'], tick_data['symbol'], tick_data['price'], tick_data['size'])
-            )
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"[Storage Error] {e}")
+        # 2. Hand off to the write-behind queue (batched commit on the writer thread)
+        for row in rows:
+            self.writer.submit(row)
+
+        if self.latency is not None:
+            samples = []
+            for tick_data in ticks:
+                if 'recv_time' not in tick_data:
+                    continue
+                samples.append(('event_to_recv', tick_data['recv_time'] - tick_data['timestamp']))
+                samples.append(('recv_to_parse', tick_data['parse_time'] - tick_data['recv_time']))
+                samples.append(('parse_to_buffer', append_time - tick_data['parse_time']))
+                if 'trade_time' in tick_data:
+                    samples.append(('trade_to_event', tick_data['timestamp'] - tick_data['trade_time']))
+            if samples:
+                self.latency.record_tick(samples)
+
+    def save_batch(self, batch: dict):
+        """
+        Column-batch save (see decoder.AggTradeDecoder.drain): 'symbol' list plus
+        'timestamp'/'price'/'size' arrays, optionally 'trade_time'/'recv_time'/'parse_time'.
+        Each symbol's ring buffer is extended with vectorized slice copies.
+        """
+        if self.read_only:
+            raise RuntimeError(f"TradeStore({self.db_name}) is read-only")
+        symbols = batch['symbol']
+        n = len(symbols)
+        if n == 0:
+            return
+        ts, price, size = batch['timestamp'], batch['price'], batch['size']
+
+        # Group row indices by symbol (ticks keep their arrival order within a symbol)
+        groups = {}
+        for i, sym in enumerate(symbols):
+            groups.setdefault(sym, []).append(i)
 
-    def get_recent_ticks(self, limit=1000) -> pd.DataFrame:
-        """Fetch raw ticks from memory buffer (Fastest)."""
-        all_data = []
         with self.lock:
-            for sym in self.symbols:
-                # Convert deque to list
-                data = list(self.memory_buffer[sym])
-                if data:
-                    all_data.extend(data)
-        
-        if not all_data:
+            if self.closed:
+                return
+            # 1. Write to Memory
+            append_time = time.time()
+            for sym, idx in groups.items():
+                if len(idx) == n:
+                    self.memory_buffer[sym].extend(ts, price, size)
+                else:
+                    self.memory_buffer[sym].extend(ts[idx], price[idx], size[idx])
+                self.last_append_time[sym] = append_time
+
+        if self.journal is not None:
+            agg_id = batch.get('agg_id')
+            for sym, idx in groups.items():
+                if len(idx) == n:
+                    self.journal.append(sym, ts, price, size, agg_id)
+                else:
+                    self.journal.append(sym, ts[idx], price[idx], size[idx],
+                                        None if agg_id is None else agg_id[idx])
+
+        # 2. Hand off to the write-behind queue (batched commit on the writer thread)
+        ts_list = ts.tolist()
+        for row in zip(ts_list, symbols, price.tolist(), size.tolist()):
+            self.writer.submit(row + (append_time,))
+
+        if self.latency is not None and 'recv_time' in batch:
+            recv, parse = batch['recv_time'], batch['parse_time']
+            samples = [('event_to_recv', v) for v in (recv - ts).tolist()]
+            samples += [('recv_to_parse', v) for v in (parse - recv).tolist()]
+            samples += [('parse_to_buffer', v) for v in (append_time - parse).tolist()]
+            if 'trade_time' in batch:
+                samples += [('trade_to_event', v) for v in (ts - batch['trade_time']).tolist()]
+            self.latency.record_tick(samples)
+
+    def flush(self):
+        """Block until all queued ticks are committed to SQLite."""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        """
+        Drain the write queue and stop the writer thread (called at exit).
+        Ticks handed to save_tick / save_ticks / save_batch afterwards are dropped.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    def compact_archive(self):
+        """Roll closed days out of SQLite into the Parquet archive (see archive.py)."""
+        if self.archive is None or self.read_only:
+            return {}
+        self.flush()
+        return self.archive.compact(self.db_name)
+
+    def get_writer_stats(self) -> dict:
+        """Queue depth, batch size and commit latency counters of the disk writer."""
+        return self.writer.get_stats() if self.writer is not None else {}
+
+    def record_consumption(self, symbols=None):
+        """
+        Mark that analytics consumed the buffer now: records how stale the newest
+        tick of each symbol is relative to its exchange event and buffer append.
+        """
+        if self.latency is None:
+            return
+        now = time.time()
+        samples = []
+        with self.lock:
+            for sym in symbols or self.symbols:
+                buf = self.memory_buffer[sym]
+                if len(buf):
+                    newest_event = buf.timestamp[buf.head - 1]
+                    samples.append(('event_to_analytics', now - newest_event))
+                    samples.append(('buffer_to_analytics', now - self.last_append_time[sym]))
+        self.latency.record_tick(samples)
+
+    def get_latency_stats(self) -> dict:
+        """Per-stage latency summary: {stage: {'count', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', ...}}."""
+        if self.latency is None:
+            return {}
+        return self.latency.summary()
+
+    def reset_latency_stats(self):
+        if self.latency is not None:
+            self.latency.reset()
+
+    def get_tick_arrays(self, symbols=None, cursors=None, copy=True):
+        """
+        Per-symbol columnar ticks from the memory buffer, oldest first.
+        cursors: {symbol: sequence number} from a previous call; only ticks
+        appended since are returned (None = everything buffered).
+        Returns ({symbol: (timestamp, price, size)}, new_cursors). See
+        TickRingBuffer.since for copy=False semantics.
+        """
+        symbols = self.symbols if symbols is None else symbols
+        cursors = cursors or {}
+        arrays, new_cursors = {}, {}
+        with self.lock:
+            for sym in symbols:
+                buf = self.memory_buffer.get(sym)
+                if buf is None:
+                    continue
+                arrays[sym], new_cursors[sym] = buf.since(cursors.get(sym, 0), copy=copy)
+        return arrays, new_cursors
+
+    def data_version(self, symbols=None) -> tuple:
+        """
+        Monotonic per-symbol data version (ticks ever appended to each memory
+        buffer), in `symbols` order. Anything derived from the buffers can be
+        cached under it: an unchanged version means no new tick has arrived.
+        """
+        symbols = self.symbols if symbols is None else symbols
+        with self.lock:
+            return tuple(self.memory_buffer[sym].total if sym in self.memory_buffer else 0 for sym in symbols)
+
+    def get_merged_ticks(self, symbols=None) -> dict:
+        """All buffered ticks as one time-ordered column set (see merge_tick_arrays)."""
+        arrays, _ = self.get_tick_arrays(symbols)
+        return merge_tick_arrays({sym: cols for sym, cols in arrays.items() if len(cols[0])})
+
+    def get_recent_ticks(self, limit=1000) -> pd.DataFrame:
+        """Fetch raw ticks from memory buffer as a long-format DataFrame."""
+        merged = self.get_merged_ticks()
+        if not len(merged['timestamp']):
             return pd.DataFrame(columns=['timestamp', 'symbol', 'price', 'size'])
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(merged['timestamp'], unit='s'),
+            'symbol': np.array(merged['symbols'], dtype=object)[merged['symbol']],
+            'price': merged['price'],
+            'size': merged['size'],
+        })
 
-        df = pd.DataFrame(all_data)
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
-        return df.sort_values('timestamp')
+    @staticmethod
+    def _to_epoch(t):
+        """Accept epoch seconds, datetime or pd.Timestamp (naive = UTC)."""
+        if t is None or isinstance(t, (int, float, np.integer, np.floating)):
+            return t
+        return pd.Timestamp(t).value / 1e9
 
-    def get_resampled_data(self, interval='1min', limit=1000) -> pd.DataFrame:
+    def query(self, symbols=None, start=None, end=None, columns=('timestamp', 'price', 'size'),
+              chunk_size=config.QUERY_CHUNK_SIZE):
         """
-        Fetch historical data from SQLite and resample.
-        Used for 1m/5m charts.
+        Time-range scan of the tick history, streamed in chunks.
+        symbols: list of symbols (None = all). start (inclusive) / end (exclusive):
+        epoch seconds, datetime or pd.Timestamp. columns: subset of
+        timestamp/symbol/price/size.
+        Yields {column: np.ndarray} chunks ordered by (symbol, timestamp). Archived
+        days come from the Parquet tier (partition-pruned, column-projected), the
+        hot rows from the (symbol, timestamp) covering index with parameterized SQL.
+        """
+        columns = list(columns)
+        unknown = set(columns) - set(self.QUERY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        start, end = self._to_epoch(start), self._to_epoch(end)
+
+        if self.archive is None:
+            yield from self._query_sqlite(symbols, start, end, columns, chunk_size)
+            return
+
+        if symbols is None:
+            conn = sqlite3.connect(self.db_name)
+            try:
+                hot = {r[0] for r in conn.execute("SELECT DISTINCT symbol FROM trades")}
+            finally:
+                conn.close()
+            symbols = sorted(hot | set(self.archive.symbols()))
+        for sym in symbols:
+            yield from self._query_tiers(sym, start, end, columns, chunk_size)
+
+    def _query_tiers(self, sym, start, end, columns, chunk_size):
+        """
+        One symbol from both tiers in timestamp order, without duplicates.
+        Hot rows at or before the newest archived tick (a day between its
+        Parquet write and the SQLite delete, or late ticks) are merged into
+        the archive chunks, the archived copy winning on equal timestamps;
+        newer hot rows are streamed after them.
         """
+        parts = self.archive.partitions(sym, start, end)
+        if not parts:
+            yield from self._query_sqlite([sym], start, end, columns, chunk_size)
+            return
+        split = float(np.nextafter(max(p['max_ts'] for p in parts), np.inf))
+        cols = columns if 'timestamp' in columns else columns + ['timestamp']
+
+        early = list(self._query_sqlite([sym], start, split if end is None else min(end, split), cols, chunk_size))
+        early = {c: np.concatenate([chunk[c] for chunk in early]) for c in cols} if early else None
+        for chunk in self.archive.read(sym, start, end, cols, chunk_size):
+            if early is not None and len(early['timestamp']):
+                # Hot rows up to this chunk's last timestamp go into it
+                n = int(np.searchsorted(early['timestamp'], chunk['timestamp'][-1], side='right'))
+                if n:
+                    merged = {c: np.concatenate([chunk[c], early[c][:n]]) for c in cols}
+                    order = np.argsort(merged['timestamp'], kind='stable')
+                    ts = merged['timestamp'][order]
+                    order = order[np.r_[True, ts[1:] != ts[:-1]]]
+                    chunk = {c: merged[c][order] for c in cols}
+                    early = {c: early[c][n:] for c in cols}
+            yield {c: chunk[c] for c in columns}
+        if early is not None and len(early['timestamp']):
+            yield {c: early[c] for c in columns}
+        if end is None or end > split:
+            yield from self._query_sqlite([sym], split if start is None else max(start, split), end, columns, chunk_size)
+
+    def _query_sqlite(self, symbols, start, end, columns, chunk_size):
+        where, params = [], []
+        if symbols is not None:
+            symbols = list(symbols)
+            if not symbols:
+                return
+            where.append(f"symbol IN ({', '.join('?' * len(symbols))})")
+            params.extend(symbols)
+        if start is not None:
+            where.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("timestamp < ?")
+            params.append(end)
+
+        sql = f"SELECT {', '.join(columns)} FROM trades INDEXED BY idx_sym_ts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY symbol, timestamp"
+
         conn = sqlite3.connect(self.db_name)
-        # Fetch raw data roughly covering the needed interval
-        # Simplified query: fetch last N rows (production would use time range)
-        query = f"SELECT timestamp, symbol, price FROM trades ORDER BY timestamp DESC LIMIT {limit * 10}"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield {
+                    col: np.array(values, dtype=object if col == 'symbol' else np.float64)
+                    for col, values in zip(columns, zip(*rows))
+                }
+        finally:
+            conn.close()
+
+    def query_df(self, symbols=None, start=None, end=None, columns=('timestamp', 'symbol', 'price', 'size')) -> pd.DataFrame:
+        """query() collected into one DataFrame (timestamps left as epoch seconds)."""
+        chunks = list(self.query(symbols, start, end, columns))
+        if not chunks:
+            return pd.DataFrame(columns=list(columns))
+        return pd.DataFrame({col: np.concatenate([c[col] for c in chunks]) for col in columns})
+
+    def get_latest_timestamp(self, symbols=None):
+        """Newest stored tick time (epoch seconds) across `symbols`, or None."""
+        conn = sqlite3.connect(self.db_name)
+        try:
+            latest = None
+            for sym in symbols or self.symbols:
+                row = conn.execute("SELECT MAX(timestamp) FROM trades WHERE symbol = ?", (sym,)).fetchone()
+                newest = row[0]
+                if newest is None and self.archive is not None:
+                    parts = self.archive.partitions(sym)
+                    newest = max((p['max_ts'] for p in parts), default=None)
+                if newest is not None and (latest is None or newest > latest):
+                    latest = newest
+            return latest
+        finally:
+            conn.close()
+
+    def get_bars(self, symbols=None, interval='1m', start=None, end=None, limit=None) -> pd.DataFrame:
+        """
+        OHLCV bars (open/high/low/close/volume/vwap/trades) per symbol, long format
+        indexed by bar start time. Persisted bars are merged with the bars still
+        open in memory, so the newest bar is always current.
+        start (inclusive) / end (exclusive) filter on bar start; limit keeps the
+        newest `limit` bars per symbol.
+        """
+        if interval not in config.BAR_INTERVALS:
+            raise ValueError(f"Unknown bar interval '{interval}' (available: {', '.join(config.BAR_INTERVALS)})")
+        symbols = list(symbols or self.symbols)
+        start, end = self._to_epoch(start), self._to_epoch(end)
+
+        where, params = ["symbol = ?"], []
+        if start is not None:
+            where.append("start >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("start < ?")
+            params.append(end)
+        sql = f"SELECT {', '.join(BarAggregator.COLUMNS)} FROM bars_{interval} WHERE {' AND '.join(where)} ORDER BY start DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        rows = []
+        conn = sqlite3.connect(self.db_name)
+        try:
+            for sym in symbols:
+                rows.extend(conn.execute(sql, [sym] + params).fetchall())
+        finally:
+            conn.close()
+        for bar in self.bars.snapshot(interval, symbols):
+            if (start is None or bar[1] >= start) and (end is None or bar[1] < end):
+                rows.append(bar)
+
+        if not rows:
+            return pd.DataFrame(columns=['symbol', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'trades'])
+
+        df = pd.DataFrame(rows, columns=BarAggregator.COLUMNS)
+        # A bar can exist both on disk (partial, e.g. after a restart) and in memory: merge
+        df = df.sort_values(['symbol', 'start', 'last_ts'], kind='mergesort')
+        df = df.groupby(['symbol', 'start'], sort=True).agg(
+            open=('open', 'first'), high=('high', 'max'), low=('low', 'min'), close=('close', 'last'),
+            volume=('volume', 'sum'), notional=('notional', 'sum'), trades=('trades', 'sum')
+        ).reset_index()
+        if limit is not None:
+            df = df.groupby('symbol', group_keys=False).tail(int(limit))
+
+        df['vwap'] = df['notional'] / df['volume'].where(df['volume'] > 0)
+        df['timestamp'] = pd.to_datetime(df['start'], unit='s')
+        return df.set_index('timestamp')[['symbol', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'trades']]
+
+    def get_resampled_data(self, interval='1min', limit=1000, symbols=None, end=None) -> pd.DataFrame:
+        """
+        Fetch historical data from SQLite and resample.
+        Used for 1m/5m charts. Intervals with pre-aggregated bars are served
+        from the bar tables (O(bars)); others scan only the `limit` intervals
+        ending at `end` (default: newest stored tick) for the requested symbols.
+        """
+        symbols = symbols or self.symbols
+        bar_interval = BAR_ALIASES.get(interval, interval)
+        if bar_interval in config.BAR_INTERVALS and end is None:
+            bars = self.get_bars(symbols, bar_interval, limit=limit)
+            if bars.empty:
+                return pd.DataFrame()
+            closes = bars.pivot(columns='symbol', values='close')
+            return closes.ffill().dropna().tail(limit)
+
+        end = self._to_epoch(end) if end is not None else self.get_latest_timestamp(symbols)
+        if end is None:
+            return pd.DataFrame()
+        span = pd.Timedelta(pd.tseries.frequencies.to_offset(interval)).total_seconds() * limit
+        # end is inclusive here: nudge the exclusive bound past the newest tick
+        df = self.query_df(symbols, end - span, np.nextafter(end, np.inf), columns=('timestamp', 'symbol', 'price'))
 
         if df.empty:
             return pd.DataFrame()
@@ -112,7 +974,11 @@ class TradeStore:
         return resampled.tail(limit)
 
     def clear_db(self):
+        self.flush()
         conn = sqlite3.connect(self.db_name)
         conn.execute("DELETE FROM trades")
+        for name in config.BAR_INTERVALS:
+            conn.execute(f"DELETE FROM bars_{name}")
         conn.commit()
         conn.close()
+        self.bars.clear()
@@ -0,0 +1,188 @@
+﻿"""
+Parallel parameter sweep for the pair backtest.
+Evaluates every (model, lookback window, entry z, exit z) combination of the
+given grids on a process pool and returns a results cube of session PnL,
+signal flips and max drawdown.
+
+- The aligned x/y columns are placed once in a shared-memory block; workers
+  attach to it by name, so the data is never pickled per task.
+- Work is split per (model, window): calculate_metrics runs once per task and
+  the whole entry/exit grid is backtested on its z-score in one
+  QuantEngine.run_backtest_batch call. The Kalman hedge ratio does not
+  depend on the window, so it is filtered once in the parent and shared
+  the same way.
+
+Usage:
+    python sweep.py ticks.csv BTCUSDT ETHUSDT --windows 50,100,200 --entry 1.5,2,2.5 --exit 0,0.5
+"""
+import argparse
+import itertools
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import config
+from analytics import QuantEngine, KalmanFilterReg, BACKTEST_SUMMARY_COLUMNS
+
+RESULT_COLUMNS = BACKTEST_SUMMARY_COLUMNS
+GRID_LEVELS = ['method', 'window', 'entry_z', 'exit_z']
+
+class SharedColumns:
+    """Equal-length float64 columns in one shared-memory block, attachable by name from other processes."""
+
+    def __init__(self, columns: dict):
+        self.names = list(columns)
+        self.n = len(next(iter(columns.values())))
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * self.n * len(self.names)))
+        block = np.ndarray((len(self.names), self.n), dtype=np.float64, buffer=self.shm.buf)
+        for row, name in enumerate(self.names):
+            block[row] = columns[name]
+        del block
+
+    @property
+    def spec(self):
+        return self.shm.name, self.names, self.n
+
+    @staticmethod
+    def attach(spec):
+        """(SharedMemory handle, {name: read-only view}); keep the handle alive while using the views."""
+        name, names, n = spec
+        shm = shared_memory.SharedMemory(name=name)
+        block = np.ndarray((len(names), n), dtype=np.float64, buffer=shm.buf)
+        block.flags.writeable = False
+        return shm, {col: block[row] for row, col in enumerate(names)}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+# Per-worker state set by _init_worker: shared-memory handle, its column views and
+# the x / y frame built on them (no per-task column copies)
+_shm = None
+_cols = None
+_frame = None
+
+def _use_columns(cols):
+    global _cols, _frame
+    _cols = cols
+    _frame = pd.DataFrame({'x': cols['x'], 'y': cols['y']}, copy=False) if cols is not None else None
+
+def _init_worker(spec):
+    global _shm
+    _shm, cols = SharedColumns.attach(spec)
+    _use_columns(cols)
+
+def _run_task(method, window, entry_zs, exit_zs, delta, R):
+    if method == 'Kalman':
+        # Hedge ratio filtered once in the parent; only the z-score depends on the window
+        x, y, beta, alpha = _cols['x'], _cols['y'], _cols['kalman_beta'], _cols['kalman_alpha']
+        spread = pd.Series(y - (beta * x + alpha), index=_frame.index)
+        metrics = pd.DataFrame({'spread': spread, 'z_score': QuantEngine.spread_zscore(spread, window)})
+    else:
+        metrics = QuantEngine.calculate_metrics(_frame, window, method, delta, R)
+
+    summary = QuantEngine.run_backtest_batch(metrics, itertools.product(entry_zs, exit_zs))
+    return [(method, window) + tuple(row) for row in summary.reset_index().itertuples(index=False, name=None)]
+
+def _start_context():
+    method = config.SWEEP_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"  # forkserver is POSIX-only
+    return multiprocessing.get_context(method)
+
+def run_sweep(df, windows, entry_zs, exit_zs, methods=('OLS',), delta=config.KALMAN_DELTA, R=config.KALMAN_R,
+              workers=config.SWEEP_WORKERS, progress=None):
+    """
+    Backtest every grid combination on the aligned frame `df` (x / y columns).
+    Returns a DataFrame indexed by (method, window, entry_z, exit_z) with
+    pnl / flips / max_drawdown columns; see results_cube / sweep_heatmap.
+    progress(fraction) is called as (method, window) tasks complete.
+    """
+    x = df['x'].to_numpy(dtype=np.float64)
+    y = df['y'].to_numpy(dtype=np.float64)
+    columns = {'x': x, 'y': y}
+    if 'Kalman' in methods:
+        columns['kalman_beta'], columns['kalman_alpha'] = KalmanFilterReg(delta, R).filter(x, y)
+
+    tasks = [(m, int(w), list(entry_zs), list(exit_zs), delta, R) for m in methods for w in windows]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    rows = []
+    if workers <= 1:
+        _use_columns(columns)
+        try:
+            for k, task in enumerate(tasks, 1):
+                rows.extend(_run_task(*task))
+                if progress is not None:
+                    progress(k / len(tasks))
+        finally:
+            _use_columns(None)
+    else:
+        shared = SharedColumns(columns)
+        try:
+            # forkserver/spawn: never fork the dashboard process with its ingest, writer and
+            # compactor threads (and their locks) live; workers only need the shared block
+            with ProcessPoolExecutor(workers, mp_context=_start_context(),
+                                     initializer=_init_worker, initargs=(shared.spec,)) as pool:
+                for k, part in enumerate(pool.map(_run_task, *zip(*tasks)), 1):
+                    rows.extend(part)
+                    if progress is not None:
+                        progress(k / len(tasks))
+        finally:
+            shared.close()
+
+    results = pd.DataFrame(rows, columns=GRID_LEVELS + RESULT_COLUMNS)
+    return results.set_index(GRID_LEVELS).sort_index()
+
+def results_cube(results, metric='pnl'):
+    """Dense ndarray (method x window x entry_z x exit_z) of one metric, plus the axis labels."""
+    axes = [results.index.levels[i] for i in range(len(GRID_LEVELS))]
+    full = pd.MultiIndex.from_product(axes, names=GRID_LEVELS)
+    cube = results[metric].reindex(full).to_numpy().reshape([len(a) for a in axes])
+    return cube, dict(zip(GRID_LEVELS, [list(a) for a in axes]))
+
+def sweep_heatmap(results, metric='pnl', method='OLS', exit_z=0.0):
+    """Plotly heatmap of `metric` over window (rows) x entry z (columns) for one model and exit z."""
+    grid = results.xs((method, exit_z), level=('method', 'exit_z'))[metric].unstack('entry_z')
+    fig = go.Figure(go.Heatmap(
+        z=grid.to_numpy(), x=[f"{v:g}" for v in grid.columns], y=[str(v) for v in grid.index],
+        colorscale='RdYlGn' if metric == 'pnl' else 'Viridis',
+        colorbar=dict(title=metric),
+        hovertemplate="window=%{y}<br>entry z=%{x}<br>" + metric + "=%{z:.4f}<extra></extra>"
+    ))
+    fig.update_layout(
+        height=320, template="plotly_dark", margin=dict(l=0, r=0, t=30, b=0),
+        paper_bgcolor='rgba(0,0,0,0)', xaxis_title="Entry Z", yaxis_title="Lookback Window",
+        title=dict(text=f"{method} · exit z = {exit_z:g}", font=dict(size=12))
+    )
+    return fig
+
+def main():
+    from importer import import_csv
+
+    parser = argparse.ArgumentParser(description="Parallel backtest parameter sweep")
+    parser.add_argument('path')
+    parser.add_argument('sym_x')
+    parser.add_argument('sym_y')
+    parser.add_argument('--windows', default="50,100,200")
+    parser.add_argument('--entry', default="1.5,2.0,2.5")
+    parser.add_argument('--exit', default="0.0,0.5")
+    parser.add_argument('--methods', default="OLS,Kalman")
+    parser.add_argument('--workers', type=int, default=config.SWEEP_WORKERS)
+    args = parser.parse_args()
+
+    floats = lambda s: [float(v) for v in s.split(',')]
+    aligned, _ = import_csv(args.path, args.sym_x, args.sym_y)
+    t0 = time.perf_counter()
+    results = run_sweep(
+        aligned, [int(w) for w in args.windows.split(',')], floats(args.entry), floats(args.exit),
+        args.methods.split(','), workers=args.workers
+    )
+    print(f"[Sweep] {len(results)} combinations on {len(aligned):,} rows in {time.perf_counter() - t0:.2f}s")
+    print(results.sort_values('pnl', ascending=False).head(10).to_string())
+
+if __name__ == "__main__":
+    main()